@@ -3,12 +3,13 @@ Main Application Class for Trash Analyzer
 """
 
 import os
+import asyncio
 import tkinter as tk
 from tkinter import messagebox, ttk
 import threading
-import cv2
-import time
-import requests
+import queue
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 import json
 import base64
 from datetime import datetime
@@ -18,6 +19,28 @@ import ui_helper
 import model_helper
 import image_utils
 
+# Maximum number of queued UI updates applied per pump tick
+UI_QUEUE_MAX_PER_TICK = 50
+
+# Number of pre-decoded random image batches kept ready
+RANDOM_PREFETCH_BATCHES = 2
+
+# Seconds between dataset checks while no dataset is available to prefetch from
+PREFETCH_RETRY_INTERVAL = 5
+
+# Seconds the ESP32 holds a /next request open waiting for a new image
+ESP32_LONG_POLL_TIMEOUT = 10
+
+# Number of received ESP32 images kept in esp32_images/ (oldest are deleted; 0 keeps all)
+ESP32_ARCHIVE_MAX_FILES = 100
+
+# JPEG quality ESP32 images are re-encoded at when archived (None saves them as received)
+ESP32_ARCHIVE_JPEG_QUALITY = None
+
+# Analysis results kept between sessions, keyed by request parameters and image hash
+RESULT_CACHE_PATH = os.path.join(".", ".analysis_cache.json")
+RESULT_CACHE_MAX_ENTRIES = 1000
+
 # MARK: - Main Application Class
 class TrashAnalyzerApp:
     def __init__(self, root):
@@ -30,9 +53,52 @@ class TrashAnalyzerApp:
         self.images = []  # List of {path, name, data, display}
         self.current_image_index = -1
         
+        # Shared worker pool for analysis requests and image loading
+        self.executor = ThreadPoolExecutor(max_workers=8)
+        
+        # UI updates posted by background threads, applied by _drain_ui_queue
+        self.ui_q = queue.Queue()
+        
+        # Latest status message waiting for _flush_status
+        self._pending_status = ""
+        self._status_flush_scheduled = False
+        
+        # Analysis results cache (least recently used entries are dropped first)
+        self.result_cache = OrderedDict()
+        self.result_cache_lock = threading.Lock()
+        self._load_result_cache()
+        
+        # Background image loading state
+        self._load_futures = []
+        self._load_generation = 0
+        self._load_count = 0
+        self._load_label = ""
+        
+        # Random images decoded ahead of time by _prefetch_worker
+        self._prefetch_q = queue.Queue(maxsize=RANDOM_PREFETCH_BATCHES)
+        self._prefetch_stop = threading.Event()
+        threading.Thread(target=self._prefetch_worker, daemon=True).start()
+        
+        # ESP32 images waiting to be saved and decoded by _esp32_decode_worker
+        self._esp32_decode_q = queue.Queue()
+        threading.Thread(target=self._esp32_decode_worker, daemon=True).start()
+        
+        # Decoded ESP32 images waiting to be added to the list in one batch
+        self._pending_esp32 = []
+        self._pending_esp32_lock = threading.Lock()
+        self._esp32_flush_scheduled = False
+        
+        # Archive files written this session, oldest first
+        self._esp32_archive = deque(maxlen=ESP32_ARCHIVE_MAX_FILES or None)
+        
+        # Event loop for async provider requests, run in its own thread
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+        
         # Camera variables
         self.camera_active = False
-        self.preview_active = [False]  # Using a list to make it mutable for reference
+        self.preview_stop = None  # Event that ends the current preview session's loop
+        self.preview_thread = None
         self.current_camera_type = "Webcam (0)"
         self.esp32_connected = False
         self.connection_thread = None
@@ -41,14 +107,14 @@ class TrashAnalyzerApp:
         self.esp32_subscription_active = False
         self.esp32_subscription_ip = ""
         self.esp32_polling_thread = None
-        self.esp32_poll_stop = False
+        self.esp32_poll_stop = threading.Event()
+        self.esp32_session = None
         
         # Initialize camera at startup
         image_utils.init_camera()
         
         # Create required directories if they don't exist
         os.makedirs("esp32_images", exist_ok=True)
-        os.makedirs("esp32_base64", exist_ok=True)  # New directory for base64 data
         
         # Get available providers and models
         self.providers = model_helper.get_available_providers()
@@ -65,6 +131,9 @@ class TrashAnalyzerApp:
         # Create UI layout
         self._create_ui()
         
+        # Start pumping UI updates from background threads
+        self.root.after(20, self._drain_ui_queue)
+        
         # Bind window close event
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         
@@ -137,7 +206,8 @@ class TrashAnalyzerApp:
             bottom_left,
             self.providers,
             self.models,
-            self.analyze_image
+            self.analyze_image,
+            self.analyze_all_images
         )
         
         # Set provider change handler
@@ -155,12 +225,53 @@ class TrashAnalyzerApp:
         # Results section
         self.results_text = ui_helper.create_results_section(bottom_right)
     
+    # MARK: - UI Update Queue
+    def _drain_ui_queue(self):
+        """Apply UI updates queued by background threads (runs in the Tk main thread)"""
+        for _ in range(UI_QUEUE_MAX_PER_TICK):
+            try:
+                tag, payload = self.ui_q.get_nowait()
+            except queue.Empty:
+                break
+            
+            if tag == 'result':
+                ui_helper.update_results(self.results_text, payload)
+            elif tag == 'append_result':
+                ui_helper.append_results(self.results_text, payload)
+            elif tag == 'status':
+                self._set_status(payload)
+            elif tag == 'button':
+                button, state = payload
+                button.config(state=state)
+            elif tag == 'esp32_flush':
+                # Give images arriving together 50 ms to join the same list update
+                self.root.after(50, self.add_esp32_images_to_list)
+        
+        self.root.after(20, self._drain_ui_queue)
+    
+    def _set_status(self, message):
+        """
+        Set the status bar text, coalescing rapid updates into one repaint
+        
+        Only the latest message is applied, once per idle cycle. Must be called
+        from the Tk main thread; background threads post a 'status' update to ui_q.
+        """
+        self._pending_status = message
+        if not self._status_flush_scheduled:
+            self._status_flush_scheduled = True
+            self.root.after_idle(self._flush_status)
+    
+    def _flush_status(self):
+        """Apply the latest status message set with _set_status"""
+        self._status_flush_scheduled = False
+        self.config_widgets['status_var'].set(self._pending_status)
+    
     # MARK: - Event Handlers
     def on_provider_change(self, event):
         """Handle provider selection change"""
         provider = self.config_widgets['provider_var'].get()
         if provider:
-            # Update models for the selected provider
+            # Update models for the selected provider (a static lookup, no network access)
             models = model_helper.get_models_for_provider(provider)
             
             # Update combobox values
@@ -207,6 +318,25 @@ class TrashAnalyzerApp:
         # Release camera resources
         image_utils.release_camera()
         
+        # Stop prefetching random images
+        self._prefetch_stop.set()
+        
+        # Stop the ESP32 decode thread once queued images are done
+        self._esp32_decode_q.put(None)
+        
+        # Drop queued analysis work without waiting for requests in flight
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        
+        # Keep analysis results for the next session
+        self._save_result_cache()
+        
+        # Close the HTTP session and stop the event loop
+        try:
+            asyncio.run_coroutine_threadsafe(model_helper.close_http_session(), self.loop).result(timeout=1.0)
+        except Exception as e:
+            print(f"Error closing HTTP session: {str(e)}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        
         # Close the window
         self.root.destroy()
     
@@ -230,25 +360,35 @@ class TrashAnalyzerApp:
         if not ip_address.startswith("http"):
             ip_address = f"http://{ip_address}"
         
+        # Imported here so startup doesn't pay for requests unless ESP32 is used
+        import requests
+        
+        # One keep-alive connection reused for all requests to this ESP32
+        session = requests.Session()
+        session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        
         # Test connection first
         try:
-            response = requests.get(f"{ip_address}/", timeout=5)
+            response = session.get(f"{ip_address}/", timeout=5)
             if response.status_code != 200:
+                session.close()
                 messagebox.showwarning("Connection Error", f"Could not connect to ESP32 at {ip_address}")
                 return
         except Exception as e:
+            session.close()
             messagebox.showwarning("Connection Error", f"Error connecting to ESP32: {str(e)}")
             return
         
         # Set subscription variables
         self.esp32_subscription_ip = ip_address
+        self.esp32_session = session
         self.esp32_subscription_active = True
-        self.esp32_poll_stop = False
+        self.esp32_poll_stop.clear()
         
         # Update UI
         self.esp32_sub_var.set("Unsubscribe")
         self.esp32_ip_entry.config(state="disabled")
-        self.config_widgets['status_var'].set(f"Subscribed to ESP32 at {ip_address}")
+        self._set_status(f"Subscribed to ESP32 at {ip_address}")
         
         # Start polling thread
         self.esp32_polling_thread = threading.Thread(
@@ -259,8 +399,8 @@ class TrashAnalyzerApp:
     
     def stop_esp32_subscription(self):
         """Stop subscribing to ESP32 camera"""
-        # Set flag to stop polling thread
-        self.esp32_poll_stop = True
+        # Wake and stop the polling thread
+        self.esp32_poll_stop.set()
         
         # Wait for thread to terminate
         if self.esp32_polling_thread and self.esp32_polling_thread.is_alive():
@@ -270,19 +410,35 @@ class TrashAnalyzerApp:
         self.esp32_subscription_active = False
         self.esp32_polling_thread = None
         
+        # Close the keep-alive connection
+        if self.esp32_session:
+            self.esp32_session.close()
+            self.esp32_session = None
+        
         # Update UI
         self.esp32_sub_var.set("Subscribe to ESP32")
         self.esp32_ip_entry.config(state="normal")
-        self.config_widgets['status_var'].set("ESP32 subscription stopped")
+        self._set_status("ESP32 subscription stopped")
     
     def poll_esp32_for_images(self):
-        """Poll ESP32 for new images in a separate thread"""
+        """Receive new images from the ESP32 in a separate thread
+        
+        Listens on the ESP32's /ws endpoint so images arrive as soon as they are
+        taken. Without push, long-polls /next, and only falls back to polling
+        /check on firmware that has neither.
+        """
+        if self.receive_esp32_pushes():
+            return
+        
+        if self.long_poll_esp32():
+            return
+        
         poll_interval = 2  # seconds
         
-        while not self.esp32_poll_stop:
+        while not self.esp32_poll_stop.is_set():
             try:
                 # Check if a new image is available
-                response = requests.get(f"{self.esp32_subscription_ip}/check", timeout=5)
+                response = self.esp32_session.get(f"{self.esp32_subscription_ip}/check", timeout=5)
                 if response.status_code == 200:
                     data = json.loads(response.text)
                     if data.get("newImage", False):
@@ -290,81 +446,204 @@ class TrashAnalyzerApp:
                         self.download_base64_from_esp32()
                         
                         # Reset the new image flag on ESP32
-                        requests.get(f"{self.esp32_subscription_ip}/reset", timeout=5)
+                        self.esp32_session.get(f"{self.esp32_subscription_ip}/reset", timeout=5)
             except Exception as e:
                 print(f"Error polling ESP32: {str(e)}")
             
-            # Sleep for poll interval
-            for _ in range(poll_interval * 10):  # Allow for more responsive termination
-                if self.esp32_poll_stop:
+            # Sleep for poll interval, returning as soon as the subscription stops
+            if self.esp32_poll_stop.wait(poll_interval):
+                return
+    
+    def long_poll_esp32(self):
+        """Fetch images from the ESP32's /next long-poll endpoint until the subscription stops
+        
+        Each request waits on the ESP32 until an image is ready and returns it
+        directly (200 with JPEG bytes) or times out (204). Fetching an image
+        dequeues it, so there is no separate /check or /reset round trip.
+        
+        Returns:
+            True if the subscription was served by /next, False if the firmware
+            doesn't have it and the caller should fall back to polling /check
+        """
+        url = f"{self.esp32_subscription_ip}/next?timeout={ESP32_LONG_POLL_TIMEOUT}"
+        
+        while not self.esp32_poll_stop.is_set():
+            try:
+                response = self.esp32_session.get(url, timeout=ESP32_LONG_POLL_TIMEOUT + 5)
+            except Exception as e:
+                print(f"Error polling ESP32: {str(e)}")
+                if self.esp32_poll_stop.wait(2):
                     break
-                time.sleep(0.1)
+                continue
+            
+            if response.status_code == 404:
+                return False
+            
+            # Drop an image that arrived after the subscription was stopped
+            if response.status_code == 200 and not self.esp32_poll_stop.is_set():
+                try:
+                    self.save_esp32_image(response.content)
+                except Exception as e:
+                    print(f"Error handling ESP32 image: {str(e)}")
+            elif response.status_code != 204:
+                print(f"Error polling ESP32: status code {response.status_code}")
+                if self.esp32_poll_stop.wait(2):
+                    break
+        
+        return True
+    
+    def receive_esp32_pushes(self):
+        """Receive images pushed over the ESP32 WebSocket until the subscription stops
+        
+        Returns:
+            True if the subscription was served over the WebSocket, False if the
+            caller should fall back to polling (no websockets package, no /ws
+            endpoint, or the connection dropped)
+        """
+        # Optional dependency; imported once per subscription, not per image
+        try:
+            from websockets.sync.client import connect
+        except ImportError:
+            return False
+        
+        ws_url = "ws://" + self.esp32_subscription_ip.split("://", 1)[-1] + "/ws"
+        try:
+            ws = connect(ws_url, open_timeout=5, max_size=None)
+        except Exception as e:
+            print(f"ESP32 WebSocket unavailable, polling instead: {str(e)}")
+            return False
+        
+        with ws:
+            while not self.esp32_poll_stop.is_set():
+                try:
+                    # Short timeout so a stopped subscription is noticed promptly
+                    message = ws.recv(timeout=1.0)
+                except TimeoutError:
+                    continue
+                except Exception as e:
+                    print(f"ESP32 WebSocket closed, polling instead: {str(e)}")
+                    return False
+                
+                # Binary frames are raw JPEG, text frames are the legacy base64 payload
+                try:
+                    if isinstance(message, str):
+                        message = base64.b64decode(message)
+                    self.save_esp32_image(message)
+                except Exception as e:
+                    print(f"Error handling ESP32 image: {str(e)}")
+        
+        return True
     
     def download_base64_from_esp32(self):
-        """Download base64 data from the ESP32 camera"""
+        """Download the latest image from the ESP32 camera
+        
+        Fetches raw JPEG bytes from /jpg. Firmware that only serves base64 text
+        (from /jpg or the older /base64 endpoint) still works.
+        """
         try:
-            # Download the base64 data
-            response = requests.get(f"{self.esp32_subscription_ip}/base64", timeout=10)
+            response = self.esp32_session.get(f"{self.esp32_subscription_ip}/jpg", timeout=10)
             if response.status_code != 200:
-                print(f"Error downloading base64: status code {response.status_code}")
-                return
-            
-            # Get the base64 string
-            base64_data = response.text
+                # Older firmware without the /jpg endpoint
+                response = self.esp32_session.get(f"{self.esp32_subscription_ip}/base64", timeout=10)
+                if response.status_code != 200:
+                    print(f"Error downloading image: status code {response.status_code}")
+                    return
             
-            # Create a timestamp for filenames
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            
-            # Save the base64 data to file
-            base64_filename = f"esp32_base64_{timestamp}.txt"
-            base64_filepath = os.path.join("esp32_base64", base64_filename)
+            if response.headers.get("Content-Type", "").startswith("text/plain"):
+                # Legacy base64 payload
+                self.save_esp32_image(base64.b64decode(response.text))
+            else:
+                self.save_esp32_image(response.content)
             
-            with open(base64_filepath, "w") as f:
-                f.write(base64_data)
+        except Exception as e:
+            print(f"Error downloading image from ESP32: {str(e)}")
+    
+    def save_esp32_image(self, image_data):
+        """Queue JPEG bytes received from the ESP32 for saving and decoding
+        
+        The subscription thread only hands the bytes over, so a slow decode never
+        delays the next download. _esp32_decode_worker does the rest.
+        
+        Args:
+            image_data: JPEG file bytes
+        """
+        self._esp32_decode_q.put(image_data)
+    
+    def _esp32_decode_worker(self):
+        """Save and decode queued ESP32 images, then add them to the list (runs in a background thread)"""
+        while True:
+            image_data = self._esp32_decode_q.get()
+            if image_data is None:
+                # Application is closing
+                return
             
-            # Convert base64 to image and save
             try:
-                # Decode base64 data
-                image_data = base64.b64decode(base64_data)
-                
-                # Save as image file
-                image_filename = f"esp32_{timestamp}.jpg"
-                image_filepath = os.path.join("esp32_images", image_filename)
-                
-                with open(image_filepath, "wb") as f:
-                    f.write(image_data)
-                
-                # Add to image list (in main thread)
-                self.root.after(0, lambda: self.add_esp32_image_to_list(image_filepath, image_filename))
-                
+                self._save_and_decode_esp32_image(image_data)
             except Exception as e:
-                print(f"Error converting base64 to image: {str(e)}")
-            
-        except Exception as e:
-            print(f"Error downloading base64 from ESP32: {str(e)}")
+                print(f"Error handling ESP32 image: {str(e)}")
     
-    def add_esp32_image_to_list(self, filepath, filename):
-        """Add a downloaded ESP32 image to the image list (called in main thread)"""
-        # Load the image
-        image_info = image_utils.load_image_from_path(filepath)
+    def _save_and_decode_esp32_image(self, image_data):
+        """Archive one ESP32 JPEG and add the decoded image to the list"""
+        image_filepath, image_filename = self._new_esp32_image_path()
+        
+        image_info = image_utils.load_image_from_bytes(image_data, image_filepath, image_filename)
         if not image_info:
             return
         
-        # Add to our list
-        self.images.append(image_info)
-        
-        # Add to listbox
-        self.file_listbox.insert(tk.END, filename)
+        # Keep the file as an archive; the list uses the image already in memory
+        if ESP32_ARCHIVE_JPEG_QUALITY is None:
+            # One unbuffered write avoids copying the payload through a file object buffer
+            # (O_BINARY keeps Windows from translating newlines)
+            flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0)
+            fd = os.open(image_filepath, flags, 0o644)
+            try:
+                os.write(fd, image_data)
+            finally:
+                os.close(fd)
+        else:
+            image_utils.save_jpeg(image_filepath, image_info['data'], ESP32_ARCHIVE_JPEG_QUALITY)
+        
+        # Only keep the most recent archive files from this session
+        if ESP32_ARCHIVE_MAX_FILES:
+            if len(self._esp32_archive) == ESP32_ARCHIVE_MAX_FILES:
+                try:
+                    os.unlink(self._esp32_archive[0])
+                except OSError as e:
+                    print(f"Error removing old ESP32 image: {str(e)}")
+            self._esp32_archive.append(image_filepath)
+        
+        # Add to image list (in main thread), batching images that arrive together
+        with self._pending_esp32_lock:
+            self._pending_esp32.append(image_info)
+            if not self._esp32_flush_scheduled:
+                self._esp32_flush_scheduled = True
+                self.ui_q.put(('esp32_flush', None))
+    
+    def _new_esp32_image_path(self):
+        """Return (filepath, filename) for a new timestamped ESP32 image"""
+        # Milliseconds keep images that arrive within the same second apart
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
+        image_filename = f"esp32_{timestamp}.jpg"
+        return os.path.join("esp32_images", image_filename), image_filename
+    
+    def add_esp32_images_to_list(self):
+        """Add all decoded ESP32 images received since the last call to the image list (called in main thread)"""
+        with self._pending_esp32_lock:
+            image_infos = self._pending_esp32
+            self._pending_esp32 = []
+            self._esp32_flush_scheduled = False
+        
+        if not image_infos:
+            return
         
-        # Select this image if no other is selected
-        if self.current_image_index < 0:
-            index = len(self.images) - 1
-            self.file_listbox.selection_set(index)
-            self.current_image_index = index
-            self._display_current_image()
+        # Add to our list, selecting the first if no other is selected
+        self._append_images(image_infos)
         
         # Update status
-        self.config_widgets['status_var'].set(f"New ESP32 image received: {filename}")
+        if len(image_infos) == 1:
+            self._set_status(f"New ESP32 image received: {image_infos[0]['name']}")
+        else:
+            self._set_status(f"{len(image_infos)} new ESP32 images received")
     
     # MARK: - Camera Functions
     def connect_webcam(self, camera_type, camera_id):
@@ -379,8 +658,8 @@ class TrashAnalyzerApp:
         self.camera_controls['camera_var'].configure(state="disabled")
         
         # Update status
-        self.config_widgets['status_var'].set(f"Connecting to {camera_type}...")
-        self.root.update()
+        self._set_status(f"Connecting to {camera_type}...")
+        self.root.update_idletasks()
         
         # Set camera source
         success = image_utils.set_camera_source("webcam", camera_id=int(camera_id))
@@ -389,14 +668,14 @@ class TrashAnalyzerApp:
         self.camera_controls['camera_var'].configure(state="readonly")
         
         if success:
-            self.config_widgets['status_var'].set(f"Connected to {camera_type}")
+            self._set_status(f"Connected to {camera_type}")
             self.current_camera_type = camera_type
             
             # If camera was active, restart it
             if self.camera_active:
                 self.start_camera()
         else:
-            self.config_widgets['status_var'].set(f"Failed to connect to {camera_type}")
+            self._set_status(f"Failed to connect to {camera_type}")
     
     def connect_esp32(self, camera_type, ip_address, connect_var):
         """
@@ -417,7 +696,7 @@ class TrashAnalyzerApp:
             if self.camera_active:
                 self.stop_camera()
                 
-            self.config_widgets['status_var'].set("ESP32 camera disconnected")
+            self._set_status("ESP32 camera disconnected")
             return
         
         # Validate IP address input
@@ -429,9 +708,8 @@ class TrashAnalyzerApp:
         self.camera_controls['connect_btn'].configure(state="disabled")
         self.camera_controls['ip_entry'].configure(state="disabled")
         
-        # Update status
-        self.config_widgets['status_var'].set("Connecting to ESP32 camera...")
-        self.root.update()
+        # Update status (the connection runs in a thread, so no need to force a redraw)
+        self._set_status("Connecting to ESP32 camera...")
         
         # Connect in a separate thread
         def connection_thread():
@@ -442,7 +720,7 @@ class TrashAnalyzerApp:
                 # Enable controls
                 self.root.after(0, lambda: self.camera_controls['connect_btn'].configure(state="normal"))
                 self.root.after(0, lambda: self.camera_controls['ip_entry'].configure(state="normal"))
-                self.root.after(0, lambda: self.config_widgets['status_var'].set("Failed to set up ESP32 camera"))
+                self.root.after(0, lambda: self._set_status("Failed to set up ESP32 camera"))
                 return
             
             # Test connection
@@ -470,7 +748,7 @@ class TrashAnalyzerApp:
         self.current_camera_type = "ESP32 Camera"
         
         # Update status
-        self.config_widgets['status_var'].set("ESP32 camera connected successfully")
+        self._set_status("ESP32 camera connected successfully")
         
         # If camera was active, restart it
         if self.camera_active:
@@ -486,7 +764,7 @@ class TrashAnalyzerApp:
         self.esp32_connected = False
         
         # Update status
-        self.config_widgets['status_var'].set("Failed to connect to ESP32 camera")
+        self._set_status("Failed to connect to ESP32 camera")
     
     def toggle_camera(self):
         """Toggle camera on/off"""
@@ -503,28 +781,32 @@ class TrashAnalyzerApp:
         
         # Special check for ESP32 camera
         if self.camera_controls['camera_var'].get() == "ESP32 Camera" and not self.esp32_connected:
-            self.config_widgets['status_var'].set("ESP32 camera not connected. Please connect first.")
+            self._set_status("ESP32 camera not connected. Please connect first.")
             return
         
         # Clear the current image display
         self.image_label.config(image='')
         
         # Update status
-        self.config_widgets['status_var'].set("Starting camera...")
-        self.root.update()
+        self._set_status("Starting camera...")
+        self.root.update_idletasks()
         
         # Show camera controls
         self.camera_controls['frame'].pack(fill=tk.X, padx=5, pady=5)
         
-        # Start camera preview
-        success = image_utils.start_camera_preview(
+        # Start camera preview with its own stop event, so a previous preview thread
+        # still stuck in a fetch can never be revived by this one
+        preview_stop = threading.Event()
+        self.preview_stop = preview_stop
+        self.preview_thread = image_utils.start_camera_preview(
             self.image_label,
             self.config_widgets['status_var'],
-            self.preview_active
+            preview_stop,
+            lambda image: ui_helper.post_preview_frame(self.image_label, image, preview_stop)
         )
         
-        if not success:
-            self.config_widgets['status_var'].set("Failed to start camera")
+        if self.preview_thread is None:
+            self._set_status("Failed to start camera")
             self.camera_controls['frame'].pack_forget()
             return
         
@@ -537,11 +819,12 @@ class TrashAnalyzerApp:
         if not self.camera_active:
             return
         
-        # Stop preview loop
-        self.preview_active[0] = False
-        
-        # Give time for preview thread to stop
-        time.sleep(0.1)
+        # Stop preview loop and wait for the thread to exit
+        if self.preview_stop:
+            self.preview_stop.set()
+        if self.preview_thread:
+            self.preview_thread.join(0.5)
+            self.preview_thread = None
         
         # Hide camera controls
         self.camera_controls['frame'].pack_forget()
@@ -557,7 +840,7 @@ class TrashAnalyzerApp:
             self._display_current_image()
         
         # Update status
-        self.config_widgets['status_var'].set("Camera stopped")
+        self._set_status("Camera stopped")
     
     def capture_from_camera(self):
         """Capture image from camera preview"""
@@ -571,7 +854,7 @@ class TrashAnalyzerApp:
         image_info = image_utils.capture_image_embedded(captures_dir)
         
         if not image_info:
-            self.config_widgets['status_var'].set("Failed to capture image")
+            self._set_status("Failed to capture image")
             return
         
         # Stop camera preview
@@ -581,31 +864,22 @@ class TrashAnalyzerApp:
         if not self.images:
             self.clear_images(ask=False)
         
-        # Add to our list
-        self.images.append(image_info)
-        
-        # Add to listbox
-        self.file_listbox.insert(tk.END, image_info['name'])
-        
-        # Select this image
-        index = len(self.images) - 1
-        self.file_listbox.selection_set(index)
-        self.current_image_index = index
-        self._display_current_image()
+        # Add to our list and select this image
+        self._append_image(image_info, select=True)
         
         # Update status
-        self.config_widgets['status_var'].set("Image captured from camera")
+        self._set_status("Image captured from camera")
     
     def analyze_live_camera(self):
         """Analyze the current live camera feed"""
         if not self.camera_active:
             return
         
-        # Get the current frame from the camera
+        # Get the current frame from the camera (skipping one that has gone stale)
         frame, frame_rgb = image_utils.get_current_frame()
         
         if frame is None:
-            self.config_widgets['status_var'].set("Failed to get frame from camera")
+            self._set_status("Failed to get frame from camera")
             return
             
         # Create a temporary image info
@@ -633,34 +907,28 @@ class TrashAnalyzerApp:
         # Clear existing images
         self.clear_images(ask=False)
         
-        # Load selected images
-        count = 0
-        for path in file_paths:
-            image_info = image_utils.load_image_from_path(path)
-            if image_info:
-                # Add to our list
-                self.images.append(image_info)
-                
-                # Add to listbox
-                self.file_listbox.insert(tk.END, image_info['name'])
-                
-                count += 1
-        
-        # Select first image if available
-        if count > 0:
-            self.file_listbox.selection_set(0)
-            self.current_image_index = 0
-            self._display_current_image()
-        
-        # Update status
-        self.config_widgets['status_var'].set(f"Loaded {count} images")
+        # Load selected images in the background
+        self._load_images(file_paths, "images")
     
     def get_random_images(self):
         """Get random images from datasets directory"""
         # If camera is active, stop it first
         if self.camera_active:
             self.stop_camera()
+        
+        # Use a prefetched batch when one is ready
+        try:
+            batch = self._prefetch_q.get_nowait()
+        except queue.Empty:
+            batch = None
+        
+        if batch:
+            self.clear_images(ask=False)
+            self._append_images(batch)
             
+            self._set_status(f"Loaded {len(batch)} random images")
+            return
+        
         # Get random image paths
         image_paths = image_utils.get_random_images()
         
@@ -674,27 +942,8 @@ class TrashAnalyzerApp:
         # Clear existing images
         self.clear_images(ask=False)
         
-        # Load selected images
-        count = 0
-        for path in image_paths:
-            image_info = image_utils.load_image_from_path(path)
-            if image_info:
-                # Add to our list
-                self.images.append(image_info)
-                
-                # Add to listbox
-                self.file_listbox.insert(tk.END, image_info['name'])
-                
-                count += 1
-        
-        # Select first image if available
-        if count > 0:
-            self.file_listbox.selection_set(0)
-            self.current_image_index = 0
-            self._display_current_image()
-        
-        # Update status
-        self.config_widgets['status_var'].set(f"Loaded {count} random images")
+        # Load selected images in the background
+        self._load_images(image_paths, "random images")
     
     def clear_images(self, ask=True):
         """Clear all loaded images"""
@@ -706,6 +955,9 @@ class TrashAnalyzerApp:
             if not messagebox.askyesno("Clear Images", "Really clear all images?"):
                 return
         
+        # Drop any images still loading
+        self._cancel_image_loading()
+        
         # Clear image data
         self.images = []
         self.current_image_index = -1
@@ -716,7 +968,112 @@ class TrashAnalyzerApp:
         ui_helper.update_results(self.results_text, "")
         
         # Update status
-        self.config_widgets['status_var'].set("All images cleared")
+        self._set_status("All images cleared")
+    
+    def _load_images(self, paths, label):
+        """
+        Decode images on the worker pool and add them to the list as they finish
+        
+        Args:
+            paths: Image file paths to load
+            label: Description used in the status message (e.g. "random images")
+        """
+        self._cancel_image_loading()
+        
+        self._load_futures = [self.executor.submit(image_utils.load_image_from_path, path) for path in paths]
+        self._load_count = 0
+        self._load_label = label
+        
+        self._set_status(f"Loading {len(paths)} {label}...")
+        self.root.after(30, self._drain_load_futures, self._load_generation)
+    
+    def _cancel_image_loading(self):
+        """Cancel pending image loads and stop their drain loop"""
+        for future in self._load_futures:
+            future.cancel()
+        self._load_futures = []
+        self._load_generation += 1
+    
+    def _drain_load_futures(self, generation):
+        """Add finished image loads to the list in order (runs in the Tk main thread)"""
+        # A newer load or a clear replaced this one
+        if generation != self._load_generation:
+            return
+        
+        # Only take finished loads from the front so the list keeps the file order
+        loaded = []
+        while self._load_futures and self._load_futures[0].done():
+            image_info = self._load_futures.pop(0).result()
+            if image_info:
+                loaded.append(image_info)
+        
+        if loaded:
+            self._append_images(loaded)
+            self._load_count += len(loaded)
+        
+        if self._load_futures:
+            self.root.after(30, self._drain_load_futures, generation)
+        else:
+            # Update status
+            self._set_status(f"Loaded {self._load_count} {self._load_label}")
+    
+    def _append_image(self, image_info, select=False):
+        """
+        Add a loaded image to the list
+        
+        Args:
+            image_info: Image info dictionary
+            select: Select the new image even if another one is already selected
+        """
+        self._append_images([image_info], select)
+    
+    def _append_images(self, image_infos, select=False):
+        """
+        Add loaded images to the list with a single listbox insert
+        
+        This is the only place images are added, so self.images and the listbox
+        always hold the same entries at the same indices.
+        
+        Args:
+            image_infos: List of image info dictionaries
+            select: Select the first new image even if another one is already selected
+        """
+        first_index = len(self.images)
+        
+        # Add to our list
+        self.images.extend(image_infos)
+        
+        # Add to listbox
+        self.file_listbox.insert(tk.END, *[image_info['name'] for image_info in image_infos])
+        
+        # Select the first image as soon as it is available
+        if select or self.current_image_index < 0:
+            self.file_listbox.selection_clear(0, tk.END)
+            self.file_listbox.selection_set(first_index)
+            self.current_image_index = first_index
+            self._display_current_image()
+    
+    def _prefetch_worker(self):
+        """Keep batches of decoded random images ready (runs in a background thread)"""
+        while not self._prefetch_stop.is_set():
+            image_paths = image_utils.get_random_images()
+            if not image_paths:
+                # No dataset yet - check again later, so one extracted while the app runs is picked up
+                self._prefetch_stop.wait(PREFETCH_RETRY_INTERVAL)
+                continue
+            
+            # cv2.imread releases the GIL, so decode the batch in parallel
+            with ThreadPoolExecutor(max_workers=min(8, len(image_paths))) as pool:
+                batch = list(pool.map(image_utils.load_image_from_path, image_paths))
+            batch = [image_info for image_info in batch if image_info]
+            
+            # Wait for room in the queue, checking regularly for shutdown
+            while not self._prefetch_stop.is_set():
+                try:
+                    self._prefetch_q.put(batch, timeout=0.5)
+                    break
+                except queue.Full:
+                    continue
     
     def _display_current_image(self):
         """Display the currently selected image"""
@@ -724,10 +1081,10 @@ class TrashAnalyzerApp:
             return
         
         # Get image data
-        img_rgb = self.images[self.current_image_index]['display']
+        image_info = self.images[self.current_image_index]
         
-        # Display image
-        ui_helper.display_image(self.image_label, img_rgb)
+        # Display image (the PhotoImage is kept on the image_info for reselection)
+        ui_helper.display_image(self.image_label, image_info['display'], image_info)
     
     # MARK: - Image Analysis
     def analyze_image(self):
@@ -748,6 +1105,15 @@ class TrashAnalyzerApp:
         # Run analysis
         self._run_analysis_on_image(current_image)
     
+    def _analyze_buttons(self):
+        """Buttons that start an analysis; they are disabled together since every run writes to results_text"""
+        buttons = (
+            self.config_widgets['analyze_button'],
+            self.config_widgets['analyze_all_button'],
+            self.camera_controls['analyze_live_btn']
+        )
+        return [button for button in buttons if button is not None]
+    
     def _run_analysis_on_image(self, image_info):
         """Run analysis on the specified image"""
         # Get prompt
@@ -766,43 +1132,213 @@ class TrashAnalyzerApp:
             messagebox.showwarning("No Model", "Please select a provider and model.")
             return
         
-        # Disable analyze button during processing
-        self.config_widgets['analyze_button'].config(state=tk.DISABLED)
-        if self.camera_active:
-            self.camera_controls['analyze_live_btn'].config(state=tk.DISABLED)
+        # Disable analyze buttons during processing
+        for button in self._analyze_buttons():
+            button.config(state=tk.DISABLED)
         
-        self.config_widgets['status_var'].set("Analyzing image...")
+        self._set_status("Analyzing image...")
         
         # Clear results
         ui_helper.update_results(self.results_text, "")
         
-        # Run analysis in background thread
-        def analysis_thread():
+        # Gemini runs as a coroutine on the shared event loop, other providers on the worker pool
+        if model_helper.supports_async(provider):
+            future = asyncio.run_coroutine_threadsafe(
+                self._analyze_cached_async(provider, model_name, prompt, image_info, temperature, max_tokens),
+                self.loop
+            )
+        else:
+            future = self.executor.submit(
+                self._analyze_cached,
+                provider,
+                model_name,
+                prompt,
+                image_info,
+                temperature,
+                max_tokens
+            )
+        
+        future.add_done_callback(self._on_analysis_done)
+    
+    def _on_result_chunk(self, text):
+        """Show partial text from a streaming analysis (called from a background thread)"""
+        self.ui_q.put(('append_result', text))
+    
+    def _on_analysis_done(self, future):
+        """Show the result of a finished analysis future (called from a background thread)"""
+        if future.cancelled():
+            return
+        
+        try:
+            result = future.result()
+            
+            # Update UI with results
+            self.ui_q.put(('result', result))
+            self.ui_q.put(('status', "Analysis complete"))
+        
+        except Exception as e:
+            self.ui_q.put(('result', f"ERROR: {str(e)}"))
+            self.ui_q.put(('status', "Error during analysis"))
+        
+        finally:
+            # Enable buttons again
+            for button in self._analyze_buttons():
+                self.ui_q.put(('button', (button, tk.NORMAL)))
+    
+    def analyze_all_images(self):
+        """Analyze every loaded image, batched into as few requests as possible"""
+        if not self.images:
+            messagebox.showwarning("No Images", "Please load some images first.")
+            return
+        
+        # Get prompt
+        prompt = self.prompt_text.get("1.0", tk.END).strip()
+        if not prompt:
+            messagebox.showwarning("No Prompt", "Please enter a prompt.")
+            return
+        
+        # Get parameters
+        temperature = self.config_widgets['temperature'].get()
+        max_tokens = self.config_widgets['max_length'].get()
+        provider = self.config_widgets['provider_var'].get()
+        model_name = self.config_widgets['model_var'].get()
+        
+        if not provider or not model_name:
+            messagebox.showwarning("No Model", "Please select a provider and model.")
+            return
+        
+        # Snapshot the images so later list changes don't affect this run
+        images = list(self.images)
+        
+        # Disable analyze buttons during processing
+        for button in self._analyze_buttons():
+            button.config(state=tk.DISABLED)
+        
+        self._set_status(f"Analyzing {len(images)} images...")
+        
+        # Clear results
+        ui_helper.update_results(self.results_text, "")
+        
+        # Run batch analysis in background thread
+        def batch_thread():
             try:
-                # Call model helper to analyze image
-                result = model_helper.analyze_image(
-                    provider, 
-                    model_name, 
-                    prompt, 
-                    image_info['data'],
-                    temperature,
-                    max_tokens
-                )
+                # Encode all images up front on every core; the cache keys hash these bytes
+                image_utils.get_jpeg_bytes_batch(images)
                 
-                # Update UI with results
-                self.root.after(0, lambda: ui_helper.update_results(self.results_text, result))
-                self.root.after(0, lambda: self.config_widgets['status_var'].set("Analysis complete"))
+                # Only send the images that aren't cached yet
+                keys = [
+                    self._result_cache_key(provider, model_name, prompt, temperature, max_tokens, image_info)
+                    for image_info in images
+                ]
+                results = [self._get_cached_result(key) for key in keys]
+                missing = [index for index, result in enumerate(results) if result is None]
+                
+                if missing:
+                    fresh_results = model_helper.analyze_images(
+                        provider,
+                        model_name,
+                        prompt,
+                        [images[index] for index in missing],
+                        temperature,
+                        max_tokens
+                    )
+                    for index, result in zip(missing, fresh_results):
+                        results[index] = result
+                        self._store_result(keys[index], result)
+                
+                # One line per image, in list order
+                lines = [f"{image_info['name']}: {result.strip()}" for image_info, result in zip(images, results)]
+                result_text = "\n".join(lines)
+                
+                self.ui_q.put(('result', result_text))
+                self.ui_q.put(('status', f"Analyzed {len(images)} images"))
             
             except Exception as e:
-                error_msg = str(e)
-                self.root.after(0, lambda: ui_helper.update_results(self.results_text, f"ERROR: {error_msg}"))
-                self.root.after(0, lambda: self.config_widgets['status_var'].set("Error during analysis"))
+                self.ui_q.put(('result', f"ERROR: {str(e)}"))
+                self.ui_q.put(('status', "Error during batch analysis"))
             
             finally:
                 # Enable buttons again
-                self.root.after(0, lambda: self.config_widgets['analyze_button'].config(state=tk.NORMAL))
-                if self.camera_active:
-                    self.root.after(0, lambda: self.camera_controls['analyze_live_btn'].config(state=tk.NORMAL))
+                for button in self._analyze_buttons():
+                    self.ui_q.put(('button', (button, tk.NORMAL)))
         
-        # Start thread
-        threading.Thread(target=analysis_thread, daemon=True).start()
\ No newline at end of file
+        # Submit to the worker pool
+        self.executor.submit(batch_thread)
+    
+    # MARK: - Result Cache
+    def _result_cache_key(self, provider, model_name, prompt, temperature, max_tokens, image_info):
+        """Build the cache key for an analysis request (hashes the image on first use)"""
+        return json.dumps([
+            provider,
+            model_name,
+            prompt,
+            round(temperature, 2),
+            max_tokens,
+            image_utils.get_image_hash(image_info)
+        ])
+    
+    def _get_cached_result(self, key):
+        """Get a cached analysis result, or None on a cache miss"""
+        with self.result_cache_lock:
+            result = self.result_cache.get(key)
+            if result is not None:
+                self.result_cache.move_to_end(key)
+            return result
+    
+    def _store_result(self, key, result):
+        """Cache an analysis result, skipping errors so they are retried next time"""
+        if not result or result.startswith("ERROR:"):
+            return
+        
+        with self.result_cache_lock:
+            self.result_cache[key] = result
+            self.result_cache.move_to_end(key)
+            while len(self.result_cache) > RESULT_CACHE_MAX_ENTRIES:
+                self.result_cache.popitem(last=False)
+    
+    def _analyze_cached(self, provider, model_name, prompt, image_info, temperature, max_tokens):
+        """Analyze an image, answering from the result cache when possible (runs in a worker thread)"""
+        key = self._result_cache_key(provider, model_name, prompt, temperature, max_tokens, image_info)
+        result = self._get_cached_result(key)
+        if result is None:
+            result = model_helper.analyze_image(
+                provider, model_name, prompt, image_info, temperature, max_tokens, self._on_result_chunk
+            )
+            self._store_result(key, result)
+        return result
+    
+    async def _analyze_cached_async(self, provider, model_name, prompt, image_info, temperature, max_tokens):
+        """Async version of _analyze_cached, run on the app's event loop"""
+        # Hashing may encode the image, so keep it off the event loop
+        key = await asyncio.to_thread(
+            self._result_cache_key, provider, model_name, prompt, temperature, max_tokens, image_info
+        )
+        result = self._get_cached_result(key)
+        if result is None:
+            result = await model_helper.analyze_image_async(
+                provider, model_name, prompt, image_info, temperature, max_tokens, self._on_result_chunk
+            )
+            self._store_result(key, result)
+        return result
+    
+    def _load_result_cache(self):
+        """Load analysis results saved by a previous session"""
+        if not os.path.exists(RESULT_CACHE_PATH):
+            return
+        
+        try:
+            with open(RESULT_CACHE_PATH, "r") as f:
+                self.result_cache.update(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Error loading analysis cache: {str(e)}")
+    
+    def _save_result_cache(self):
+        """Save analysis results for the next session"""
+        try:
+            with self.result_cache_lock:
+                data = dict(self.result_cache)
+            
+            with open(RESULT_CACHE_PATH, "w") as f:
+                json.dump(data, f)
+        except OSError as e:
+            print(f"Error saving analysis cache: {str(e)}")
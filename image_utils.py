@@ -3,20 +3,21 @@ Image processing utilities for Trash Analyzer
 """
 
 import os
+import sys
 import cv2
-import glob
 import random
 import shutil
 from PIL import Image
 import time
-import tkinter as tk
-from tkinter import ttk
 import numpy as np
-from PIL import ImageTk
 import threading
 import urllib.request
+import socket
 import base64
-from io import BytesIO
+import hashlib
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
 
 # Global camera object that persists throughout the application
 _camera = None
@@ -24,17 +25,110 @@ _camera_lock = threading.Lock()
 _camera_type = "webcam"  # Default camera type
 _camera_ip = ""  # For ESP32 camera
 
+# Newest webcam frame, kept fresh by a single capture thread and shared by the
+# preview, captures and live analysis so none of them block on camera I/O
+_latest_frame_cond = threading.Condition()
+_latest_frame = None
+_latest_frame_time = 0.0  # time.monotonic() when _latest_frame was read
+_capture_thread = None
+_capture_stop = None
+_latest_frame_wanted = 0.0  # time.monotonic() of the last get_latest_frame call
+
+# With no reader for this long (e.g. preview stopped), the capture thread exits;
+# the next get_latest_frame call starts it again
+CAPTURE_IDLE_AFTER = 1.0
+
 # MARK: - Image Loading Functions
+# Largest size the display image is shown at (matches ui_helper.display_image)
+DISPLAY_MAX_WIDTH = 500
+DISPLAY_MAX_HEIGHT = 400
+
+# JPEG decoders can produce 1/2, 1/4 and 1/8 scale images straight from the DCT blocks
+_REDUCED_READ_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+def _read_image_size(path):
+    """Get (width, height) of an image file from its header, or None if it can't be read"""
+    try:
+        # Only reads the file header
+        with Image.open(path) as img:
+            return img.size
+    except Exception:
+        return None
+
+def _reduced_read_flag(path, max_width, max_height):
+    """Pick the cheapest cv2.imread flag whose output still covers max_width x max_height"""
+    size = _read_image_size(path)
+    if size is None:
+        return cv2.IMREAD_COLOR
+    width, height = size
+    
+    # The image is shown at 1/max_ratio of its size, so any reduction up to that is invisible
+    max_ratio = max(width / max_width, height / max_height)
+    for factor, flag in _REDUCED_READ_FLAGS:
+        if factor <= max_ratio:
+            return flag
+    return cv2.IMREAD_COLOR
+
+def shrink_image(img_data, new_width, new_height):
+    """
+    Downscale an image with INTER_AREA, taking any whole-number factor first
+    
+    INTER_AREA has a fast path for integer ratios, so a 4K frame is first shrunk
+    by the largest whole factor that stays above the target size and only the
+    remaining < 2x step uses the general filter (~18 ms instead of ~27 ms for
+    3840x2160 to 1024x576).
+    
+    Args:
+        img_data: Image array
+        new_width: Target width (not larger than the image)
+        new_height: Target height (not larger than the image)
+        
+    Returns:
+        Resized image array
+    """
+    height, width = img_data.shape[:2]
+    factor = min(width // new_width, height // new_height)
+    if factor >= 2:
+        img_data = cv2.resize(img_data, (width // factor, height // factor), interpolation=cv2.INTER_AREA)
+    return cv2.resize(img_data, (new_width, new_height), interpolation=cv2.INTER_AREA)
+
+def _display_rgb(img_data):
+    """
+    Build the RGB display copy of a BGR image, no larger than the display area
+    
+    Shrinking comes first so cvtColor only converts display-sized pixels, and
+    display_image then has nothing left to resize.
+    """
+    height, width = img_data.shape[:2]
+    if height > DISPLAY_MAX_HEIGHT or width > DISPLAY_MAX_WIDTH:
+        scale = min(DISPLAY_MAX_HEIGHT / height, DISPLAY_MAX_WIDTH / width)
+        new_height, new_width = int(height * scale), int(width * scale)
+        img_data = shrink_image(img_data, new_width, new_height)
+    
+    # A contiguous copy: a reversed-channel view would make every later
+    # cv2.resize / Image.fromarray of it slower
+    return cv2.cvtColor(img_data, cv2.COLOR_BGR2RGB)
+
 def load_image_from_path(path):
-    """Load an image from a path and return BGR and RGB versions"""
+    """
+    Load an image from a path for display
+    
+    Large images are decoded at reduced scale for display only; 'data' is then
+    None and the full-size image is decoded again only to build the API JPEG.
+    """
     try:
         # Read image in BGR format (OpenCV default)
-        img_data = cv2.imread(path)
+        read_flag = _reduced_read_flag(path, DISPLAY_MAX_WIDTH, DISPLAY_MAX_HEIGHT)
+        img_data = cv2.imread(path, read_flag)
         if img_data is None:
             return None
         
-        # Convert BGR to RGB for display
-        img_rgb = cv2.cvtColor(img_data, cv2.COLOR_BGR2RGB)
+        # Display-sized RGB copy
+        img_rgb = _display_rgb(img_data)
         
         # Get file name
         name = os.path.basename(path)
@@ -43,47 +137,64 @@ def load_image_from_path(path):
         return {
             'path': path,
             'name': name,
-            'data': img_data,     # Original BGR format for OpenCV
+            # Original BGR format for OpenCV (None until needed if decoded reduced)
+            'data': img_data if read_flag == cv2.IMREAD_COLOR else None,
             'display': img_rgb    # RGB format for display
         }
     except Exception as e:
         print(f"Error loading image {path}: {e}")
         return None
 
-def load_image_from_base64(base64_str, filename="base64_image.jpg"):
-    """Load an image from a base64 string and return BGR and RGB versions"""
-    try:
-        # Decode base64 to binary data
-        if isinstance(base64_str, str):
-            # Sometimes base64 strings can have header info, remove it if present
-            if "base64," in base64_str:
-                base64_str = base64_str.split("base64,")[1]
-            img_data = base64.b64decode(base64_str)
-        else:
-            img_data = base64_str
-            
-        # Convert to numpy array
-        nparr = np.frombuffer(img_data, np.uint8)
+def load_image_from_bytes(buf, path=None, filename="image.jpg"):
+    """
+    Decode encoded image bytes (e.g. a JPEG) and return BGR and RGB versions
+    
+    Args:
+        buf: Encoded image as bytes, bytearray or memoryview
+        path: File the bytes were saved to, if any
+        filename: Name shown in the image list
         
-        # Decode the image
-        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    Returns:
+        Image info dictionary or None if decoding failed
+    """
+    try:
+        # Decode straight from the buffer without copying it
+        img = cv2.imdecode(np.frombuffer(buf, np.uint8), cv2.IMREAD_COLOR)
         if img is None:
-            print("Failed to decode base64 image")
+            print(f"Failed to decode image {filename}")
             return None
         
-        # Convert BGR to RGB for display
-        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        # Display-sized RGB copy
+        img_rgb = _display_rgb(img)
         
         # Return information dictionary
         return {
-            'path': None,  # No file path as it's from base64
+            'path': path,
             'name': filename,
             'data': img,       # Original BGR format for OpenCV
             'display': img_rgb # RGB format for display
         }
+    except Exception as e:
+        print(f"Error loading image {filename}: {e}")
+        return None
+
+def load_image_from_base64(base64_str, filename="base64_image.jpg"):
+    """Load an image from a base64 string and return BGR and RGB versions"""
+    try:
+        # Decode base64 to binary data
+        if isinstance(base64_str, str):
+            # Sometimes base64 strings can have header info, remove it if present
+            if "base64," in base64_str:
+                base64_str = base64_str.split("base64,")[1]
+            img_data = base64.b64decode(base64_str)
+        else:
+            img_data = base64_str
     except Exception as e:
         print(f"Error loading image from base64: {e}")
         return None
+    
+    # No file path as it's from base64
+    return load_image_from_bytes(img_data, filename=filename)
 
 # MARK: - Camera Functions
 def init_camera():
@@ -94,18 +205,19 @@ def init_camera():
         if _camera is None:
             try:
                 # Try to initialize the camera with lower resolution first for faster startup
-                _camera = cv2.VideoCapture(0)
+                _camera = _open_webcam(0)
                 
                 if _camera is not None and _camera.isOpened():
                     # Set to a reasonable default resolution - can be changed later if needed
                     _camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
                     _camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                    _limit_camera_buffer(_camera)
                     
                     # Read a few frames to stabilize the camera
                     for _ in range(5):
                         _camera.read()
                     
-                    print("Camera initialized successfully")
+                    print(f"Camera initialized successfully ({_camera_format(_camera)})")
                 else:
                     print("Failed to initialize camera")
                     _camera = None
@@ -130,6 +242,7 @@ def set_camera_source(camera_type, camera_id=0, ip_address=""):
     with _camera_lock:
         # Release existing camera if webcam type
         if _camera is not None and _camera_type == "webcam":
+            _stop_capture_thread()
             _camera.release()
             _camera = None
         
@@ -138,18 +251,19 @@ def set_camera_source(camera_type, camera_id=0, ip_address=""):
         
         if camera_type == "webcam":
             try:
-                _camera = cv2.VideoCapture(int(camera_id))
+                _camera = _open_webcam(int(camera_id))
                 
                 if _camera is not None and _camera.isOpened():
                     # Set to a reasonable default resolution
                     _camera.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
                     _camera.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
+                    _limit_camera_buffer(_camera)
                     
                     # Read a few frames to stabilize the camera
                     for _ in range(5):
                         _camera.read()
                     
-                    print(f"Webcam {camera_id} initialized successfully")
+                    print(f"Webcam {camera_id} initialized successfully ({_camera_format(_camera)})")
                     return True
                 else:
                     print(f"Failed to initialize webcam {camera_id}")
@@ -177,6 +291,55 @@ def set_camera_source(camera_type, camera_id=0, ip_address=""):
             print(f"Unknown camera type: {camera_type}")
             return False
             
+# Seconds to wait for the ESP32 camera (connect, read) so a Wi-Fi glitch fails fast instead of hanging
+ESP32_FETCH_TIMEOUT = (1.0, 1.5)
+
+# Bounds for the preview's retry delay after a failed ESP32 frame (seconds, doubled per failure)
+ESP32_RETRY_MIN = 0.05
+ESP32_RETRY_MAX = 0.5
+
+# TCP options for ESP32 sockets: no Nagle delay, and keep-alive probes so dead connections get noticed
+_ESP32_SOCKET_OPTIONS = [
+    (socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),
+    (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1),
+]
+
+@functools.cache
+def _esp32_session():
+    """Shared keep-alive HTTP session for ESP32 camera requests, None if requests is missing"""
+    try:
+        import requests
+    except ImportError:
+        return None
+    
+    class KeepAliveAdapter(requests.adapters.HTTPAdapter):
+        """HTTPAdapter whose pooled connections use _ESP32_SOCKET_OPTIONS"""
+        def init_poolmanager(self, *args, **kwargs):
+            kwargs["socket_options"] = _ESP32_SOCKET_OPTIONS
+            super().init_poolmanager(*args, **kwargs)
+    
+    # Preview and captures reuse these connections instead of a new TCP handshake per frame.
+    # No automatic retries: a failed frame is simply retried on the next preview tick
+    session = requests.Session()
+    session.mount("http://", KeepAliveAdapter(pool_connections=1, pool_maxsize=2, max_retries=0))
+    return session
+
+def _fetch_esp32(url):
+    """
+    GET a URL from the ESP32 camera and return the response body
+    
+    Raises on connection errors and non-2xx responses, like urlopen.
+    """
+    session = _esp32_session()
+    if session is None:
+        # urlopen takes a single timeout, applied to the connect and to each read
+        with urllib.request.urlopen(url, timeout=max(ESP32_FETCH_TIMEOUT)) as response:
+            return response.read()
+    
+    response = session.get(url, timeout=ESP32_FETCH_TIMEOUT)
+    response.raise_for_status()
+    return response.content
+
 def test_esp32_connection(ip_address):
     """
     Test connection to an ESP32 camera
@@ -193,11 +356,8 @@ def test_esp32_connection(ip_address):
             # Add http:// prefix if missing
             ip_address = f"http://{ip_address}"
             
-        # Try to access the root page first
-        response = urllib.request.urlopen(f"{ip_address}/")
-        if response.getcode() != 200:
-            print(f"Failed to connect to ESP32 at {ip_address}")
-            return False
+        # Try to access the root page first (raises if the ESP32 doesn't answer with 2xx)
+        _fetch_esp32(f"{ip_address}/")
             
         # If URL ends with slash, append the image path
         if ip_address.endswith("/"):
@@ -206,8 +366,7 @@ def test_esp32_connection(ip_address):
             test_url = f"{ip_address}/cam-lo.jpg"
         
         # Try to open the URL
-        img_resp = urllib.request.urlopen(test_url)
-        imgnp = np.array(bytearray(img_resp.read()), dtype=np.uint8)
+        imgnp = np.frombuffer(_fetch_esp32(test_url), dtype=np.uint8)
         im = cv2.imdecode(imgnp, -1)
         
         if im is not None:
@@ -224,14 +383,158 @@ def get_camera():
     """Get the global camera object, initializing it if necessary"""
     global _camera
     
-    with _camera_lock:
-        if _camera_type == "webcam":
-            if _camera is None or not _camera.isOpened():
-                init_camera()
-            return _camera
-        else:
-            # For ESP32, we don't return a camera object
+    if _camera_type == "webcam":
+        with _camera_lock:
+            camera = _camera
+        
+        # init_camera takes the lock itself
+        if camera is None or not camera.isOpened():
+            init_camera()
+        return _camera
+    else:
+        # For ESP32, we don't return a camera object
+        return None
+
+def _webcam_backend():
+    """Capture backend with the lowest latency on this platform"""
+    if sys.platform.startswith('linux'):
+        return cv2.CAP_V4L2
+    if sys.platform == 'win32':
+        return cv2.CAP_MSMF
+    if sys.platform == 'darwin':
+        return cv2.CAP_AVFOUNDATION
+    return cv2.CAP_ANY
+
+def _open_webcam(camera_id):
+    """
+    Open a webcam with the platform's native backend, asking for MJPG frames
+    
+    MJPG keeps USB frames compressed, which allows higher frame rates than raw
+    YUYV at the same resolution. Falls back to OpenCV's default backend if
+    the native one can't open the device.
+    
+    Args:
+        camera_id: Webcam index
+        
+    Returns:
+        cv2.VideoCapture (check isOpened())
+    """
+    backend = _webcam_backend()
+    camera = cv2.VideoCapture(camera_id, backend)
+    if not camera.isOpened() and backend != cv2.CAP_ANY:
+        camera.release()
+        camera = cv2.VideoCapture(camera_id)
+    
+    if camera.isOpened():
+        # Ignored by cameras (and backends) that can't deliver MJPG
+        camera.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+    return camera
+
+def _camera_format(camera):
+    """Pixel format the camera actually delivers, as a FOURCC string (e.g. 'MJPG', 'YUYV')"""
+    code = int(camera.get(cv2.CAP_PROP_FOURCC))
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4)).strip('\x00') or "unknown"
+
+def _limit_camera_buffer(camera):
+    """Keep only the newest frame in the driver queue so reads aren't stale"""
+    # Backends that ignore this (e.g. MJPEG/RTSP streams) are kept drained by _capture_loop
+    camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+def _ensure_capture_thread(camera):
+    """Start the thread that keeps the latest frame slot filled, if it isn't running"""
+    global _capture_thread, _capture_stop, _latest_frame
+    
+    with _latest_frame_cond:
+        if _capture_thread is not None and _capture_thread.is_alive():
+            return
+        
+        _latest_frame = None
+        _capture_stop = threading.Event()
+        _capture_thread = threading.Thread(
+            target=_capture_loop,
+            args=(camera, _capture_stop),
+            daemon=True
+        )
+        _capture_thread.start()
+
+def _stop_capture_thread():
+    """Stop the capture thread and empty the latest frame slot"""
+    global _capture_thread, _latest_frame
+    
+    with _latest_frame_cond:
+        thread = _capture_thread
+        _capture_thread = None
+        if thread is not None:
+            _capture_stop.set()
+    
+    # Join outside the condition so the capture loop can finish its last store
+    if thread is not None:
+        thread.join(1.0)
+    
+    with _latest_frame_cond:
+        _latest_frame = None
+
+def _capture_loop(camera, stop):
+    """Read webcam frames into the latest frame slot until stopped or idle (runs in its own thread)"""
+    global _latest_frame, _latest_frame_time, _capture_thread
+    
+    while not stop.is_set():
+        # Nobody is reading frames (e.g. preview stopped): exit instead of keeping a
+        # core busy. Decided under the condition, which get_latest_frame holds while
+        # it marks itself as a reader and checks the thread, so no reader is left
+        # waiting on a thread that just quit. The slot is emptied so the next
+        # reader waits for a fresh frame instead of getting an old one
+        if time.monotonic() - _latest_frame_wanted > CAPTURE_IDLE_AFTER:
+            with _latest_frame_cond:
+                if time.monotonic() - _latest_frame_wanted > CAPTURE_IDLE_AFTER:
+                    if _capture_thread is threading.current_thread():
+                        _capture_thread = None
+                    _latest_frame = None
+                    return
+        
+        ret, frame = camera.read()
+        if not ret:
+            # Let readers time out rather than spinning on a failed camera
+            stop.wait(0.1)
+            continue
+        frame_time = time.monotonic()
+        
+        # Each read returns a new array, so readers can keep the one they got
+        with _latest_frame_cond:
+            _latest_frame = frame
+            _latest_frame_time = frame_time
+            _latest_frame_cond.notify_all()
+
+def get_latest_frame(previous=None, timeout=1.0, max_age=None):
+    """
+    Get the newest frame from the webcam capture thread
+    
+    Args:
+        previous: A frame the caller already has; waits for a different one
+        timeout: Seconds to wait for a frame
+        max_age: If set, waits for a frame read at most this many seconds ago
+        
+    Returns:
+        BGR frame, or None if no suitable frame arrived in time
+    """
+    global _latest_frame_wanted
+    
+    camera = get_camera()
+    if camera is None or not camera.isOpened():
+        return None
+    
+    def ready():
+        if _latest_frame is None or _latest_frame is previous:
+            return False
+        return max_age is None or time.monotonic() - _latest_frame_time <= max_age
+    
+    with _latest_frame_cond:
+        # Marked as a reader before checking the thread (see _capture_loop's idle exit)
+        _latest_frame_wanted = time.monotonic()
+        _ensure_capture_thread(camera)
+        if not _latest_frame_cond.wait_for(ready, timeout):
             return None
+        return _latest_frame
 
 def release_camera():
     """Release the camera resources"""
@@ -239,39 +542,40 @@ def release_camera():
     
     with _camera_lock:
         if _camera is not None:
+            _stop_capture_thread()
             _camera.release()
             _camera = None
             print("Camera released")
 
-def start_camera_preview(image_label, status_var, preview_active):
+def start_camera_preview(image_label, status_var, preview_stop, show_frame):
     """
     Start camera preview thread
     
     Args:
-        image_label: Tkinter label widget to display camera preview
+        image_label: Tkinter widget whose after() schedules status updates on the main thread
         status_var: Tkinter StringVar for status updates
-        preview_active: List with boolean flag to control preview loop
+        preview_stop: threading.Event that ends the preview loop when set (use a new
+            one per preview, so an old thread that hasn't exited yet stays stopped)
+        show_frame: Callback taking each RGB PIL preview frame (called from the preview
+            thread, e.g. ui_helper.post_preview_frame bound to a label)
         
     Returns:
-        Boolean indicating success
+        The preview thread (so the caller can join it), or None if it failed to start
     """
     global _camera_type, _camera_ip
     
-    # Set preview active flag
-    preview_active[0] = True
-    
     if _camera_type == "webcam":
         # Get camera (initializes if needed)
         camera = get_camera()
         
         if camera is None or not camera.isOpened():
             status_var.set("Error: Could not open webcam.")
-            return False
+            return None
         
         # Start preview thread for webcam
         preview_thread = threading.Thread(
             target=update_camera_preview,
-            args=(image_label, camera, preview_active, status_var),
+            args=(image_label, camera, preview_stop, status_var, show_frame),
             daemon=True
         )
         preview_thread.start()
@@ -279,90 +583,140 @@ def start_camera_preview(image_label, status_var, preview_active):
     elif _camera_type == "esp32":
         if not _camera_ip:
             status_var.set("Error: ESP32 camera IP not set.")
-            return False
+            return None
         
         # Start preview thread for ESP32 camera
         preview_thread = threading.Thread(
             target=update_esp32_preview,
-            args=(image_label, _camera_ip, preview_active, status_var),
+            args=(image_label, _camera_ip, preview_stop, status_var, show_frame),
             daemon=True
         )
         preview_thread.start()
     
     else:
         status_var.set(f"Error: Unknown camera type '{_camera_type}'.")
-        return False
+        return None
     
     status_var.set(f"Camera active ({_camera_type}). Click 'Capture' to take a photo.")
-    return True
+    return preview_thread
 
-def update_camera_preview(image_label, camera, preview_active, status_var):
+# Decodes JPEGs straight to RGB (OpenCV >= 4.10), None on older versions
+_IMREAD_COLOR_RGB = getattr(cv2, 'IMREAD_COLOR_RGB', None)
+
+def frame_to_preview_image(frame, max_width=500, max_height=400, scratch=None, is_rgb=False):
+    """
+    Convert a camera frame to an RGB PIL image that fits the preview area
+    
+    The frame is shrunk before the BGR to RGB conversion so the color pass only
+    touches preview-sized pixels. The full-size frame is left untouched.
+    Large ratios are halved with pyrDown (SIMD blur + decimation) and only the
+    remaining < 2x step uses resize, about 3x faster than one INTER_AREA resize
+    of a 720p frame.
+    
+    Args:
+        frame: BGR (or grayscale / BGRA) camera frame
+        max_width: Maximum preview width
+        max_height: Maximum preview height
+        scratch: Optional dict kept by the caller between frames; the intermediate
+            arrays are written into the ones left in it instead of reallocated
+            (safe because the result is always converted to 3-channel RGB, which
+            Image.fromarray copies; it would wrap a 2-D or 4-channel array in place)
+        is_rgb: The frame is already RGB (decoded with _IMREAD_COLOR_RGB), so no color pass
+        
+    Returns:
+        PIL Image for ui_helper.update_label
+    """
+    if scratch is None:
+        scratch = {}
+    
+    # Resize frame for display (keeping aspect ratio)
+    height, width = frame.shape[:2]
+    
+    if height > max_height or width > max_width:
+        scale = min(max_height / height, max_width / width)
+        new_height, new_width = int(height * scale), int(width * scale)
+        level = 0
+        while scale <= 0.5:
+            frame = scratch[('pyr', level)] = cv2.pyrDown(frame, dst=scratch.get(('pyr', level)))
+            scale *= 2
+            level += 1
+        frame = scratch['resize'] = cv2.resize(
+            frame, (new_width, new_height), dst=scratch.get('resize'), interpolation=cv2.INTER_LINEAR
+        )
+    
+    # Convert to RGB for tkinter if needed. A reversed frame[..., ::-1] view is
+    # not free here: PIL copies non-contiguous arrays itself, ~7x slower than cvtColor.
+    # At preview size this pass costs ~0.1 ms; handing Tk encoded frames instead
+    # would cost more (JPEG encode ~0.8 ms, and Tk 8.6 PhotoImage can't read JPEG)
+    if frame.ndim == 2:
+        code = cv2.COLOR_GRAY2RGB
+    elif frame.shape[2] == 4:
+        code = cv2.COLOR_BGRA2RGB
+    else:
+        code = None if is_rgb else cv2.COLOR_BGR2RGB
+    if code is not None:
+        frame = scratch['rgb'] = cv2.cvtColor(frame, code, dst=scratch.get('rgb'))
+    
+    return Image.fromarray(frame)
+
+def update_camera_preview(image_label, camera, preview_stop, status_var, show_frame):
     """
     Camera preview thread function for webcam - runs in a separate thread
     
     Args:
-        image_label: Tkinter label widget
+        image_label: Tkinter widget used to schedule status updates
         camera: OpenCV VideoCapture object
-        preview_active: List with boolean flag to control preview loop
+        preview_stop: threading.Event that ends the preview loop when set
         status_var: Tkinter StringVar for status updates
+        show_frame: Callback taking each RGB PIL preview frame
     """
-    last_update = time.time()
     frame_delay = 1.0 / 30  # Target 30 FPS
+    next_update = time.monotonic()
+    frame = None
+    scratch = {}  # Resize/convert buffers reused from frame to frame
     
-    while preview_active[0]:
+    while not preview_stop.is_set():
         try:
-            # Throttle updates to target frame rate
-            current_time = time.time()
-            if current_time - last_update < frame_delay:
-                time.sleep(0.001)  # Short sleep to reduce CPU usage
-                continue
-                
-            last_update = current_time
+            # Cap updates at the target frame rate; slower cameras pace the loop
+            # themselves, since get_latest_frame blocks until a new frame arrives
+            delay = next_update - time.monotonic()
+            if delay > 0 and preview_stop.wait(delay):
+                break
+            next_update = time.monotonic() + frame_delay
             
-            # Read frame from camera
-            ret, frame = camera.read()
-            if not ret:
+            # Wait for a frame newer than the one on screen
+            frame = get_latest_frame(previous=frame)
+            if frame is None:
                 # Camera disconnected or error
                 image_label.after(0, lambda: status_var.set("Camera error: Failed to read frame"))
                 break
             
-            # Convert to RGB for tkinter
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            
-            # Resize frame for display (keeping aspect ratio)
-            height, width = frame_rgb.shape[:2]
-            max_height = 400
-            max_width = 500
+            # Shrink for display and update label in main thread
+            img_pil = frame_to_preview_image(frame, scratch=scratch)
             
-            if height > max_height or width > max_width:
-                scale = min(max_height / height, max_width / width)
-                new_height, new_width = int(height * scale), int(width * scale)
-                frame_rgb = cv2.resize(frame_rgb, (new_width, new_height))
-            
-            # Convert to PhotoImage and update label in main thread
-            img_pil = Image.fromarray(frame_rgb)
-            img_tk = ImageTk.PhotoImage(image=img_pil)
-            
-            # Update UI in the main thread
-            image_label.after(0, lambda img=img_tk: update_label(image_label, img))
+            # Hand the frame to the UI (which shows it on the main thread)
+            show_frame(img_pil)
         
         except Exception as e:
             # Handle errors gracefully
             image_label.after(0, lambda: status_var.set(f"Camera error: {str(e)}"))
             break
 
-def update_esp32_preview(image_label, ip_address, preview_active, status_var):
+def update_esp32_preview(image_label, ip_address, preview_stop, status_var, show_frame):
     """
     Camera preview thread function for ESP32 camera - runs in a separate thread
     
     Args:
-        image_label: Tkinter label widget
+        image_label: Tkinter widget used to schedule status updates
         ip_address: ESP32 camera IP address
-        preview_active: List with boolean flag to control preview loop
+        preview_stop: threading.Event that ends the preview loop when set
         status_var: Tkinter StringVar for status updates
+        show_frame: Callback taking each RGB PIL preview frame
     """
-    last_update = time.time()
     frame_delay = 1.0 / 10  # Target 10 FPS (ESP32 cameras are usually slower)
+    next_update = time.monotonic()
+    scratch = {}  # Resize/convert buffers reused from frame to frame
+    retry_delay = ESP32_RETRY_MIN  # Backoff after failed frames, reset on success
     
     # Format the URL correctly
     if ip_address.endswith("/"):
@@ -370,60 +724,42 @@ def update_esp32_preview(image_label, ip_address, preview_active, status_var):
     else:
         url = f"{ip_address}/cam-lo.jpg"
         
-    while preview_active[0]:
+    while not preview_stop.is_set():
         try:
             # Throttle updates to target frame rate
-            current_time = time.time()
-            if current_time - last_update < frame_delay:
-                time.sleep(0.01)  # Short sleep to reduce CPU usage
-                continue
-                
-            last_update = current_time
+            delay = next_update - time.monotonic()
+            if delay > 0 and preview_stop.wait(delay):
+                break
+            next_update = time.monotonic() + frame_delay
             
-            # Read frame from ESP32 camera
-            img_resp = urllib.request.urlopen(url)
-            imgnp = np.array(bytearray(img_resp.read()), dtype=np.uint8)
-            frame = cv2.imdecode(imgnp, -1)
+            # Read frame from ESP32 camera, letting the JPEG decoder output RGB when it can
+            imgnp = np.frombuffer(_fetch_esp32(url), dtype=np.uint8)
+            is_rgb = _IMREAD_COLOR_RGB is not None
+            frame = cv2.imdecode(imgnp, _IMREAD_COLOR_RGB if is_rgb else -1)
             
             if frame is None:
                 # Camera disconnected or error
                 image_label.after(0, lambda: status_var.set("ESP32 camera error: Failed to decode frame"))
-                time.sleep(1)  # Wait longer on error
+                preview_stop.wait(retry_delay)  # Back off before retrying
+                retry_delay = min(retry_delay * 2, ESP32_RETRY_MAX)
                 continue
             
-            # Convert to RGB for tkinter if needed
-            if len(frame.shape) == 3 and frame.shape[2] == 3:
-                frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            else:
-                # Already RGB or grayscale
-                frame_rgb = frame
-            
-            # Resize frame for display (keeping aspect ratio)
-            height, width = frame_rgb.shape[:2]
-            max_height = 400
-            max_width = 500
+            retry_delay = ESP32_RETRY_MIN
             
-            if height > max_height or width > max_width:
-                scale = min(max_height / height, max_width / width)
-                new_height, new_width = int(height * scale), int(width * scale)
-                frame_rgb = cv2.resize(frame_rgb, (new_width, new_height))
+            # Shrink for display and update label in main thread
+            img_pil = frame_to_preview_image(frame, scratch=scratch, is_rgb=is_rgb)
             
-            # Convert to PhotoImage and update label in main thread
-            img_pil = Image.fromarray(frame_rgb)
-            img_tk = ImageTk.PhotoImage(image=img_pil)
-            
-            # Update UI in the main thread
-            image_label.after(0, lambda img=img_tk: update_label(image_label, img))
+            # Hand the frame to the UI (which shows it on the main thread)
+            show_frame(img_pil)
         
         except Exception as e:
             # Handle errors gracefully
             image_label.after(0, lambda: status_var.set(f"ESP32 camera error: {str(e)}"))
-            time.sleep(1)  # Wait longer on error
+            preview_stop.wait(retry_delay)  # Back off before retrying
+            retry_delay = min(retry_delay * 2, ESP32_RETRY_MAX)
 
-def update_label(label, image):
-    """Update label with new image (called in main thread)"""
-    label.config(image=image)
-    label.image = image  # Keep a reference to prevent garbage collection
+# JPEG quality for saved webcam captures (they are also what gets uploaded)
+CAPTURE_JPEG_QUALITY = 90
 
 def capture_image_embedded(save_dir="."):
     """
@@ -452,14 +788,13 @@ def capture_image_embedded(save_dir="."):
             if camera is None or not camera.isOpened():
                 return None
             
-            # Read a few frames to make sure we get a recent image
-            for _ in range(3):
-                ret, frame = camera.read()
-                if not ret:
-                    return None
+            # Use the newest frame from the capture thread
+            frame = get_latest_frame()
+            if frame is None:
+                return None
             
-            # Save the image
-            cv2.imwrite(filepath, frame)
+            # Save the image (optimized Huffman tables: smaller file, same pixels)
+            save_jpeg(filepath, frame, quality=CAPTURE_JPEG_QUALITY)
             
         elif _camera_type == "esp32":
             if not _camera_ip:
@@ -472,21 +807,21 @@ def capture_image_embedded(save_dir="."):
                 url = f"{_camera_ip}/cam-lo.jpg"
             
             # Capture from ESP32
-            img_resp = urllib.request.urlopen(url)
-            imgnp = np.array(bytearray(img_resp.read()), dtype=np.uint8)
-            frame = cv2.imdecode(imgnp, -1)
+            img_bytes = _fetch_esp32(url)
+            frame = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), -1)
             
             if frame is None:
                 return None
                 
-            # Save the image
-            cv2.imwrite(filepath, frame)
+            # Save the JPEG exactly as the camera sent it (no re-encode, no quality loss)
+            with open(filepath, 'wb') as f:
+                f.write(img_bytes)
         
         else:
             return None
         
         # Create image info dictionary
-        img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        img_rgb = _display_rgb(frame)
         
         return {
             'path': filepath,
@@ -499,10 +834,17 @@ def capture_image_embedded(save_dir="."):
         print(f"Error capturing image: {e}")
         return None
 
-def get_current_frame():
+# Live analysis waits for a newer frame if the latest one is older than this (seconds)
+LIVE_FRAME_MAX_AGE = 0.2
+
+def get_current_frame(max_age=LIVE_FRAME_MAX_AGE):
     """
     Get the current frame from the camera without saving
     
+    Args:
+        max_age: Webcam frames older than this many seconds are skipped in favor
+            of the next one (None accepts any frame)
+    
     Returns:
         Tuple of (BGR image, RGB image) or (None, None) if failed
     """
@@ -514,9 +856,9 @@ def get_current_frame():
             if camera is None or not camera.isOpened():
                 return None, None
             
-            # Read the current frame
-            ret, frame = camera.read()
-            if not ret:
+            # Use the newest frame from the capture thread
+            frame = get_latest_frame(max_age=max_age)
+            if frame is None:
                 return None, None
                 
         elif _camera_type == "esp32":
@@ -529,9 +871,8 @@ def get_current_frame():
             else:
                 url = f"{_camera_ip}/cam-lo.jpg"
             
-            # Capture from ESP32
-            img_resp = urllib.request.urlopen(url)
-            imgnp = np.array(bytearray(img_resp.read()), dtype=np.uint8)
+            # Capture from ESP32 (always fresh, so max_age doesn't apply)
+            imgnp = np.frombuffer(_fetch_esp32(url), dtype=np.uint8)
             frame = cv2.imdecode(imgnp, -1)
             
             if frame is None:
@@ -540,8 +881,8 @@ def get_current_frame():
         else:
             return None, None
         
-        # Convert to RGB for display
-        img_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        # Display-sized RGB copy
+        img_rgb = _display_rgb(frame)
         
         return frame, img_rgb
         
@@ -581,34 +922,309 @@ def save_base64_as_image(base64_str, save_path):
         return False
 
 # MARK: - Random Image Functions
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+# Dataset file listings saved between sessions, rebuilt when a directory changes
+IMAGE_INDEX_PATH = os.path.join('.', '.image_index.json')
+
+_image_index = None  # {base_path: {'dirs': {dir: mtime_ns}, 'files': [paths]}}
+_image_index_lock = threading.Lock()
+
+def _scandir_recursive(path, dir_mtimes=None):
+    """
+    Yield paths of image files under a directory
+    
+    A single os.scandir walk; DirEntry caches the file type from the directory
+    listing, so no extra stat() call is made per entry.
+    
+    Args:
+        path: Directory to walk
+        dir_mtimes: Optional dict filled with {directory: st_mtime_ns} for every directory walked
+    """
+    try:
+        if dir_mtimes is not None:
+            dir_mtimes[path] = os.stat(path).st_mtime_ns
+        
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    yield from _scandir_recursive(entry.path, dir_mtimes)
+                # Name first (no syscall), then is_file() to drop broken links and other
+                # non-files; scandir has the type cached for everything but symlinks
+                elif entry.name.lower().endswith(IMAGE_EXTENSIONS) and entry.is_file():
+                    yield entry.path
+    except OSError as e:
+        print(f"Error reading directory {path}: {e}")
+
+def _index_is_current(entry):
+    """Check that no directory in an index entry changed (files added, removed or renamed)"""
+    try:
+        return all(os.stat(path).st_mtime_ns == mtime for path, mtime in entry['dirs'].items())
+    except OSError:
+        return False
+
+def _load_image_index():
+    """Read the saved dataset index, or return an empty one"""
+    try:
+        with open(IMAGE_INDEX_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_image_index(index):
+    """Write the dataset index, replacing the old file atomically"""
+    tmp_path = IMAGE_INDEX_PATH + '.tmp'
+    try:
+        with open(tmp_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(tmp_path, IMAGE_INDEX_PATH)
+    except OSError as e:
+        print(f"Error saving image index: {e}")
+
+def _get_image_files(base_path):
+    """Get all image file paths under base_path, walking the tree only if it changed"""
+    global _image_index
+    
+    with _image_index_lock:
+        if _image_index is None:
+            _image_index = _load_image_index()
+        
+        entry = _image_index.get(base_path)
+        if entry is not None and _index_is_current(entry):
+            return entry['files']
+        
+        dir_mtimes = {}
+        files = list(_scandir_recursive(base_path, dir_mtimes))
+        _image_index[base_path] = {'dirs': dir_mtimes, 'files': files}
+        _save_image_index(_image_index)
+        return files
+
+# Where get_random_images looks for the dataset (the archive may extract one level deeper)
+DATASET_SEARCH_PATHS = (
+    os.path.join('.', 'complete_dataset'),
+    os.path.join('.', 'complete_dataset', 'complete_dataset'),
+)
+
 def get_random_images(max_count=20):
     """Get random images from datasets directory"""
-    # Define common image search paths
-    search_paths = [
-        os.path.join('.', 'complete_dataset'),
-        os.path.join('.', 'complete_dataset', 'complete_dataset'),
-    ]
-    
-    # Find all image files
-    image_files = []
-    for base_path in search_paths:
-        if os.path.exists(base_path):
-            for ext in ('*.jpg', '*.jpeg', '*.png', '*.bmp'):
-                pattern = os.path.join(base_path, '**', ext)
-                image_files.extend(glob.glob(pattern, recursive=True))
-    
-    if not image_files:
-        return []
-    
-    # Select random images
-    if len(image_files) > max_count:
-        selected_images = random.sample(image_files, max_count)
-    else:
-        selected_images = image_files
+    # Find all image files (from the saved index when the tree hasn't changed).
+    # Existence is checked per call, so a dataset extracted while the app runs is found
+    file_lists = []
+    walked = []
+    for base_path in DATASET_SEARCH_PATHS:
+        if not os.path.isdir(base_path):
+            continue
+        
+        # A path nested in one already walked was covered by that walk
+        real_path = os.path.realpath(base_path)
+        if any(os.path.commonpath([real_path, done]) == done for done in walked):
+            continue
+        walked.append(real_path)
+        
+        file_lists.append(_get_image_files(base_path))
+    
+    total = sum(len(files) for files in file_lists)
+    if total <= max_count:
+        return [path for files in file_lists for path in files]
     
-    return selected_images
+    # Sample positions instead of copying every cached path into one list first
+    def path_at(index):
+        for files in file_lists:
+            if index < len(files):
+                return files[index]
+            index -= len(files)
+    
+    return [path_at(index) for index in random.sample(range(total), max_count)]
 
 # MARK: - Image Preparation for APIs
+# JPEG quality used when encoding images for API uploads
+API_JPEG_QUALITY = 85
+
+# Dynamic JPEG quality never goes below this, and keeps at least this SSIM to the original
+API_MIN_JPEG_QUALITY = 70
+API_TARGET_SSIM = 0.97
+
+# Longest side, in pixels, of images sent to the APIs (they downsample larger images anyway)
+API_MAX_SIZE = 1024
+
+@functools.cache
+def _mozjpeg():
+    """Optional mozjpeg optimizer (pip install mozjpeg-lossless-optimization), None if missing"""
+    try:
+        import mozjpeg_lossless_optimization
+    except ImportError:
+        return None
+    return mozjpeg_lossless_optimization
+
+def _imencode_jpeg(img_data, quality, optimize=False):
+    """
+    Encode a BGR image as JPEG bytes with OpenCV (libjpeg-turbo)
+    
+    optimize adds optimized Huffman tables and progressive scans: about 7%
+    smaller, but several times slower, so it is only used for final encodes.
+    """
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+    if optimize:
+        params += [int(cv2.IMWRITE_JPEG_OPTIMIZE), 1, int(cv2.IMWRITE_JPEG_PROGRESSIVE), 1]
+    
+    ok, buffer = cv2.imencode('.jpg', img_data, params)
+    if not ok:
+        raise ValueError("Failed to encode image as JPEG")
+    return buffer.tobytes()
+
+def encode_jpeg(img_data, quality=API_JPEG_QUALITY):
+    """
+    Encode a BGR image as a progressive, Huffman-optimized JPEG
+    
+    When mozjpeg is installed, the libjpeg-turbo output is losslessly re-packed
+    by it instead, which is a few percent smaller again than OpenCV's own
+    optimized encode without changing a single decoded pixel.
+    """
+    mozjpeg = _mozjpeg()
+    if mozjpeg is not None:
+        return mozjpeg.optimize(_imencode_jpeg(img_data, quality))
+    return _imencode_jpeg(img_data, quality, optimize=True)
+
+def _ssim(gray_a, gray_b):
+    """Mean structural similarity of two same-sized float32 grayscale images (0-255 range)"""
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    blur = lambda img: cv2.GaussianBlur(img, (11, 11), 1.5)
+    
+    mu_a, mu_b = blur(gray_a), blur(gray_b)
+    mu_a_sq, mu_b_sq, mu_ab = mu_a * mu_a, mu_b * mu_b, mu_a * mu_b
+    var_a = blur(gray_a * gray_a) - mu_a_sq
+    var_b = blur(gray_b * gray_b) - mu_b_sq
+    cov_ab = blur(gray_a * gray_b) - mu_ab
+    
+    ssim_map = ((2 * mu_ab + c1) * (2 * cov_ab + c2)) / ((mu_a_sq + mu_b_sq + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def encode_jpeg_dynamic(img_data, max_quality=API_JPEG_QUALITY, min_quality=API_MIN_JPEG_QUALITY,
+                        target_ssim=API_TARGET_SSIM):
+    """
+    Encode a BGR image at the lowest JPEG quality that still looks like the original
+    
+    Quality steps down from max_quality in steps of 5 while the decoded result
+    keeps an SSIM of at least target_ssim, so flat, low-detail images get much
+    smaller files and detailed ones never get bigger than at max_quality.
+    
+    Args:
+        img_data: BGR image
+        max_quality: Starting (and highest) JPEG quality
+        min_quality: Lowest JPEG quality to try
+        target_ssim: Minimum SSIM against the original
+        
+    Returns:
+        JPEG encoded image as bytes
+    """
+    gray = cv2.cvtColor(img_data, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    
+    # Trial encodes are plain; only the chosen quality gets the slower optimized encode
+    best_quality = max_quality
+    for quality in range(max_quality - 5, min_quality - 1, -5):
+        jpeg = _imencode_jpeg(img_data, quality)
+        decoded = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if _ssim(gray, decoded.astype(np.float32)) < target_ssim:
+            break
+        best_quality = quality
+    
+    return encode_jpeg(img_data, best_quality)
+
+def save_jpeg(path, img_data, quality=API_JPEG_QUALITY):
+    """Write a BGR image as an optimized (smaller Huffman tables) JPEG file"""
+    params = [int(cv2.IMWRITE_JPEG_QUALITY), quality, int(cv2.IMWRITE_JPEG_OPTIMIZE), 1]
+    if not cv2.imwrite(path, img_data, params):
+        raise ValueError(f"Failed to write {path}")
+
+def get_api_image(image_info):
+    """
+    Get the BGR image to upload, downscaled to API_MAX_SIZE
+    
+    Nothing is cached here: get_jpeg_bytes keeps only the much smaller encoded
+    result, so neither the downscaled array nor a full-size decode stays in memory.
+    """
+    data = image_info.get('data')
+    if data is None:
+        # Decoded for display at reduced scale, so read it again just for this, at
+        # the smallest DCT scale that still covers API_MAX_SIZE
+        path = image_info['path']
+        data = cv2.imread(path, _reduced_read_flag(path, API_MAX_SIZE, API_MAX_SIZE))
+        if data is None:
+            raise ValueError(f"Failed to load image {path}")
+    
+    height, width = data.shape[:2]
+    scale = API_MAX_SIZE / max(height, width)
+    
+    if scale < 1:
+        # INTER_AREA averages source pixels, the right filter for shrinking
+        new_width, new_height = int(width * scale), int(height * scale)
+        return shrink_image(data, new_width, new_height)
+    return data
+
+def get_jpeg_bytes(image_info):
+    """
+    Get the JPEG bytes for an image, encoded once and cached on the image info dictionary
+    
+    Images are downscaled with get_api_image first. Images loaded from a .jpg file that
+    need no downscaling are sent as-is, without decoding or re-encoding.
+    
+    Args:
+        image_info: Image info dictionary (needs 'data' or 'path')
+        
+    Returns:
+        JPEG encoded image as bytes
+    """
+    jpeg = image_info.get('jpeg')
+    if jpeg is not None:
+        return jpeg
+    
+    # Reuse the original file when it is already a small enough JPEG
+    path = image_info.get('path')
+    if path and path.lower().endswith(('.jpg', '.jpeg')):
+        size = _read_image_size(path)
+        if size is not None and max(size) <= API_MAX_SIZE:
+            try:
+                with open(path, 'rb') as f:
+                    jpeg = f.read()
+            except OSError as e:
+                print(f"Error reading {path}, re-encoding instead: {e}")
+    
+    if jpeg is None:
+        jpeg = encode_jpeg_dynamic(get_api_image(image_info))
+    
+    image_info['jpeg'] = jpeg
+    return jpeg
+
+def get_jpeg_bytes_batch(images, workers=None):
+    """
+    Get the JPEG bytes for several images, encoding the uncached ones in parallel
+    
+    Decoding, resizing and JPEG encoding all run in OpenCV with the GIL released,
+    so threads scale with the number of cores.
+    
+    Args:
+        images: List of image info dictionaries
+        workers: Maximum number of encoder threads (default: CPU count)
+        
+    Returns:
+        List of JPEG bytes in the same order as images
+    """
+    pending = [image_info for image_info in images if image_info.get('jpeg') is None]
+    if len(pending) > 1:
+        workers = min(workers or os.cpu_count() or 1, len(pending))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(get_jpeg_bytes, pending))
+    
+    return [get_jpeg_bytes(image_info) for image_info in images]
+
+def get_image_hash(image_info):
+    """Get a SHA-1 of the image's API JPEG bytes, computed once and cached on the image info"""
+    image_hash = image_info.get('sha1')
+    if image_hash is None:
+        image_hash = hashlib.sha1(get_jpeg_bytes(image_info)).hexdigest()
+        image_info['sha1'] = image_hash
+    return image_hash
+
 def prepare_image_for_api(img_data, provider, max_size=None):
     """
     Prepare image for different API providers with optional resizing
@@ -623,18 +1239,12 @@ def prepare_image_for_api(img_data, provider, max_size=None):
     Returns:
         Processed image in the format required by the provider
     """
-    # Convert BGR to RGB (OpenCV uses BGR by default)
-    import cv2
-    img_rgb = cv2.cvtColor(img_data, cv2.COLOR_BGR2RGB)
-    
-    # Convert to PIL image
-    from PIL import Image
-    pil_image = Image.fromarray(img_rgb)
+    provider = provider.lower()
     
     # Resize image if max_size is provided
     if max_size is not None and isinstance(max_size, int) and max_size > 0:
         # Get current dimensions
-        width, height = pil_image.size
+        height, width = img_data.shape[:2]
         
         # Check if resizing is needed
         if width > max_size or height > max_size:
@@ -648,25 +1258,20 @@ def prepare_image_for_api(img_data, provider, max_size=None):
                 new_height = max_size
                 new_width = int(width * (max_size / height))
             
-            # Resize the image
-            pil_image = pil_image.resize((new_width, new_height), Image.LANCZOS)
-    
-    # Format by provider
-    provider = provider.lower()
-    
-    # For Gemini API - Return PIL image directly
-    if provider == 'gemini':
-        return pil_image
+            # Resize the image with OpenCV's SIMD INTER_AREA filter (made for shrinking),
+            # before the color conversion so that only touches the smaller image
+            img_data = shrink_image(img_data, new_width, new_height)
     
     # For OpenAI API - Return base64-encoded image
-    elif provider == 'openai':
-        import base64
-        from io import BytesIO
-        
-        # Compress and convert to JPEG for efficient encoding
-        buffered = BytesIO()
-        pil_image.save(buffered, format="JPEG", quality=90)
-        return base64.b64encode(buffered.getvalue()).decode('utf-8')
+    if provider == 'openai':
+        # Encode straight from the BGR array (OpenCV's libjpeg-turbo), skipping
+        # the RGB conversion, PIL image and BytesIO round trip
+        return base64.b64encode(encode_jpeg_dynamic(img_data, max_quality=90)).decode('ascii')
+    
+    # Convert BGR to RGB (OpenCV uses BGR by default). Gemini does need RGB: a PIL
+    # image in BGR would show it red and blue swapped. cvtColor's SIMD channel swap
+    # (0.6 ms at 1024x768) beats fromarray on a reversed [..., ::-1] view (4 ms)
+    img_rgb = cv2.cvtColor(img_data, cv2.COLOR_BGR2RGB)
     
-    # Default - return PIL image
-    return pil_image
\ No newline at end of file
+    # For Gemini API (and by default) - Return PIL image directly
+    return Image.fromarray(img_rgb)
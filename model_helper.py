@@ -4,10 +4,20 @@ Contains functions for Gemini, OpenAI multimodal models, and local LM Studio mod
 """
 
 import os
-import requests
-from image_utils import prepare_image_for_api
+import sys
+import json
+import time
+import random
+import asyncio
+import base64
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from image_utils import get_jpeg_bytes
 from credentials import get_api_key
 
+GENAI_MISSING_ERROR = "ERROR: Google Generative AI library not installed. Install with: pip install google-generativeai"
+OPENAI_MISSING_ERROR = "ERROR: OpenAI library not installed. Install with: pip install openai"
+
 # MARK: - Available Models by Provider
 AVAILABLE_MODELS = {
     'Gemini': [
@@ -24,6 +34,81 @@ AVAILABLE_MODELS = {
     ]
 }
 
+# Maximum number of concurrent requests when a provider can't batch images
+BATCH_MAX_WORKERS = 10
+
+# Most images sent in one Gemini batch request (bigger folders are split), keeping the
+# request size and the (max_tokens + 20) * count output budget within the model's limits
+GEMINI_BATCH_MAX_IMAGES = 16
+
+# Gemini REST endpoint used by the async path (server-sent events stream)
+GEMINI_REST_STREAM_URL = "https://generativelanguage.googleapis.com/v1beta/models/{model}:streamGenerateContent?alt=sse"
+
+# Sampling settings shared by the SDK models and the REST requests, so both paths answer alike
+GEMINI_TOP_P = 0.95
+GEMINI_TOP_K = 64
+
+# Retry settings for transient API failures
+RETRY_ATTEMPTS = 3
+RETRY_BASE_DELAY = 0.5  # seconds, doubled after every failed attempt
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# MARK: - Retry Helpers
+class TransientAPIError(Exception):
+    """Raised for HTTP responses that are worth retrying (rate limits, server errors)"""
+
+def _get_transient_errors():
+    """Collect the exception types that mean "try again" for every SDK imported so far"""
+    errors = [TransientAPIError, TimeoutError, ConnectionError]
+    
+    # An SDK that was never imported can't have raised, so only check loaded modules
+    google_exceptions = sys.modules.get('google.api_core.exceptions')
+    if google_exceptions is not None:
+        errors += [
+            google_exceptions.ResourceExhausted,
+            google_exceptions.ServiceUnavailable,
+            google_exceptions.DeadlineExceeded,
+            google_exceptions.InternalServerError,
+        ]
+    
+    openai = sys.modules.get('openai')
+    if openai is not None:
+        errors += [openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError]
+    
+    aiohttp = sys.modules.get('aiohttp')
+    if aiohttp is not None:
+        errors.append(aiohttp.ClientConnectionError)
+    
+    return tuple(errors)
+
+def _retry_delay(attempt):
+    """Exponential backoff with a little jitter so parallel requests don't retry in lockstep"""
+    return RETRY_BASE_DELAY * (2 ** attempt) + random.random() * 0.1
+
+def _call_with_retry(fn, tries=RETRY_ATTEMPTS):
+    """
+    Call fn, retrying transient failures with exponential backoff
+    
+    Permanent errors (bad API key, invalid request) are raised immediately.
+    """
+    for attempt in range(tries):
+        try:
+            return fn()
+        except _get_transient_errors():
+            if attempt == tries - 1:
+                raise
+            time.sleep(_retry_delay(attempt))
+
+async def _call_with_retry_async(coro_fn, tries=RETRY_ATTEMPTS):
+    """Async version of _call_with_retry, coro_fn is called again for every attempt"""
+    for attempt in range(tries):
+        try:
+            return await coro_fn()
+        except _get_transient_errors():
+            if attempt == tries - 1:
+                raise
+            await asyncio.sleep(_retry_delay(attempt))
+
 # MARK: - Provider Availability
 def get_available_providers():
     """Check which providers have API keys configured or are available locally"""
@@ -48,63 +133,150 @@ def get_models_for_provider(provider):
         return AVAILABLE_MODELS[provider]
     return []
 
-# MARK: - Analysis Functions
-def analyze_with_gemini(prompt, image_data, model_name, temperature=0.7, max_tokens=100):
-    """Analyze an image using Google's Gemini API"""
+# MARK: - Lazy SDK Imports
+# Provider SDKs are slow to import, so each is loaded on first use and cached (None if missing)
+@functools.cache
+def _genai():
     try:
         import google.generativeai as genai
+    except ImportError:
+        return None
+    return genai
+
+@functools.cache
+def _openai():
+    try:
+        import openai
+    except ImportError:
+        return None
+    return openai
+
+@functools.cache
+def _aiohttp():
+    try:
+        import aiohttp
+    except ImportError:
+        return None
+    return aiohttp
+
+# MARK: - SDK Configuration
+_gemini_configured_key = None
+
+# GenerativeModel objects keyed by (model_name, temperature, max_tokens, json_output)
+_model_cache = {}
+
+def _configure_gemini():
+    """Configure the Gemini SDK once per API key, returns False if no key is configured"""
+    global _gemini_configured_key
+    
+    # Get API key - use the default method if no specific provider is given
+    api_key = get_api_key()
+    if not api_key:
+        return False
+    
+    # Only reconfigure when the key changes
+    if api_key != _gemini_configured_key:
+        _genai().configure(api_key=api_key)
+        _gemini_configured_key = api_key
         
-        # Get API key - use the default method if no specific provider is given
-        api_key = get_api_key()
-        if not api_key:
+        # Models built with the old key must not be reused
+        clear_model_cache()
+    return True
+
+def _get_gemini_model(model_name, temperature, max_tokens, json_output=False):
+    """Get a GenerativeModel for these settings, built once and reused across requests"""
+    key = (model_name, temperature, max_tokens, json_output)
+    model = _model_cache.get(key)
+    if model is None:
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+            "top_p": GEMINI_TOP_P,
+            "top_k": GEMINI_TOP_K
+        }
+        if json_output:
+            generation_config["response_mime_type"] = "application/json"
+        
+        model = _model_cache.setdefault(key, _genai().GenerativeModel(
+            model_name=model_name,
+            generation_config=generation_config
+        ))
+    return model
+
+# OpenAI SDK clients keyed by (base_url, api_key); each keeps its own connection pool
+_openai_clients = {}
+
+def _get_openai_client(api_key, base_url=None):
+    """Get an OpenAI client for this endpoint and key, built once so its connections stay alive"""
+    key = (base_url, api_key)
+    client = _openai_clients.get(key)
+    if client is None:
+        # Retries are handled by _call_with_retry
+        client = _openai_clients.setdefault(key, _openai().OpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=0
+        ))
+    return client
+
+def clear_model_cache():
+    """Forget cached model objects and clients (e.g. after a provider or API key change)"""
+    _model_cache.clear()
+    _openai_clients.clear()
+
+# MARK: - Analysis Functions
+def analyze_with_gemini(prompt, image_info, model_name, temperature=0.7, max_tokens=100, on_chunk=None):
+    """Analyze an image using Google's Gemini API, streaming partial text to on_chunk if given"""
+    if _genai() is None:
+        return GENAI_MISSING_ERROR
+    
+    try:
+        if not _configure_gemini():
             return "ERROR: Gemini API key not configured"
         
-        # Configure the API
-        genai.configure(api_key=api_key)
+        # Prepare the image - JPEG bytes cached on the image info, sent as inline data
+        image_part = {"mime_type": "image/jpeg", "data": get_jpeg_bytes(image_info)}
         
-        # Prepare the image - convert BGR to RGB and get PIL image
-        import cv2
-        from PIL import Image
-        img_rgb = cv2.cvtColor(image_data, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(img_rgb)
+        # Get the model for this generation config
+        model = _get_gemini_model(model_name, temperature, max_tokens)
         
-        # Create the model with generation config
-        model = genai.GenerativeModel(
-            model_name=model_name,
-            generation_config={
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-                "top_p": 0.95,
-                "top_k": 64
-            }
-        )
+        # Generate content - passing both prompt and image, streamed as it is decoded
+        response = _call_with_retry(lambda: model.generate_content([prompt, image_part], stream=True))
         
-        # Generate content - passing both prompt and image
-        response = model.generate_content([prompt, pil_image])
+        chunks = []
+        for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only a finish reason)
+                continue
+            
+            chunks.append(text)
+            if on_chunk:
+                on_chunk(text)
         
-        # Return result
-        return response.text if hasattr(response, 'text') else str(response)
+        # Return result (an empty reply is an error, so it never lands in the result cache)
+        return "".join(chunks) or "ERROR: No response received from Gemini"
     
-    except ImportError:
-        return "ERROR: Google Generative AI library not installed. Install with: pip install google-generativeai"
     except Exception as e:
         return f"ERROR: Gemini API error: {str(e)}"
 
-def analyze_with_openai(prompt, image_data, model_name, temperature=0.7, max_tokens=100):
+def analyze_with_openai(prompt, image_info, model_name, temperature=0.7, max_tokens=100):
     """Analyze an image using OpenAI's API"""
+    if _openai() is None:
+        return OPENAI_MISSING_ERROR
+    
     try:
-        from openai import OpenAI
-        
         # Get API key
         api_key = get_api_key('openai')
         if not api_key:
             return "ERROR: OpenAI API key not configured"
         
-        # Create client (current SDK pattern)
-        client = OpenAI(api_key=api_key)
+        # Reuse the client (and its open HTTPS connection) across requests
+        client = _get_openai_client(api_key)
         
         # Prepare image (base64)
-        base64_image = prepare_image_for_api(image_data, 'openai')
+        base64_image = base64.b64encode(get_jpeg_bytes(image_info)).decode('ascii')
         
         # Create message with image in Vision API format
         messages = [
@@ -121,34 +293,32 @@ def analyze_with_openai(prompt, image_data, model_name, temperature=0.7, max_tok
         ]
         
         # Generate content using chat completions API
-        response = client.chat.completions.create(
+        response = _call_with_retry(lambda: client.chat.completions.create(
             model=model_name,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens
-        )
+        ))
         
-        # Return result
-        if response.choices and len(response.choices) > 0:
+        # Return result (an empty reply is an error, so it never lands in the result cache)
+        if response.choices and response.choices[0].message.content:
             return response.choices[0].message.content
-        return "No response received from OpenAI"
+        return "ERROR: No response received from OpenAI"
     
-    except ImportError:
-        return "ERROR: OpenAI library not installed. Install with: pip install openai"
     except Exception as e:
         return f"ERROR: OpenAI API error: {str(e)}"
 
-def analyze_with_local(prompt, image_data, model_name, temperature=0.7, max_tokens=100):
+def analyze_with_local(prompt, image_info, model_name, temperature=0.7, max_tokens=100):
     """Analyze an image using OpenAI's API"""
+    if _openai() is None:
+        return OPENAI_MISSING_ERROR
+    
     try:
-        from openai import OpenAI
-        
-        
-        # Create client (current SDK pattern)
-        client = OpenAI(base_url="http://127.0.0.1:1234/v1", api_key="lm-studio")
+        # Reuse the client (and its open connection) across requests
+        client = _get_openai_client("lm-studio", base_url="http://127.0.0.1:1234/v1")
         
         # Prepare image (base64)
-        base64_image = prepare_image_for_api(image_data, 'openai')
+        base64_image = base64.b64encode(get_jpeg_bytes(image_info)).decode('ascii')
         
         # Create message with image in Vision API format
         messages = [
@@ -165,25 +335,23 @@ def analyze_with_local(prompt, image_data, model_name, temperature=0.7, max_toke
         ]
         
         # Generate content using chat completions API
-        response = client.chat.completions.create(
+        response = _call_with_retry(lambda: client.chat.completions.create(
             model=model_name,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens
-        )
+        ))
         
-        # Return result
-        if response.choices and len(response.choices) > 0:
+        # Return result (an empty reply is an error, so it never lands in the result cache)
+        if response.choices and response.choices[0].message.content:
             return response.choices[0].message.content
-        return "No response received from OpenAI"
+        return "ERROR: No response received from OpenAI"
     
-    except ImportError:
-        return "ERROR: OpenAI library not installed. Install with: pip install openai"
     except Exception as e:
         return f"ERROR: OpenAI API error: {str(e)}"
 
 # MARK: - Bridge Function
-def analyze_image(provider, model_name, prompt, image_data, temperature=0.7, max_tokens=100):
+def analyze_image(provider, model_name, prompt, image_info, temperature=0.7, max_tokens=100, on_chunk=None):
     """
     Analyze image using the appropriate provider
     
@@ -191,18 +359,272 @@ def analyze_image(provider, model_name, prompt, image_data, temperature=0.7, max
         provider: Provider name ('Gemini', 'OpenAI', 'Local')
         model_name: Name of the model
         prompt: Text prompt for analysis
-        image_data: Image data in OpenCV format (BGR)
+        image_info: Image info dictionary from image_utils (BGR 'data' and RGB 'display')
         temperature: Temperature for model generation
         max_tokens: Maximum tokens for output
+        on_chunk: Optional callback receiving partial text while a streaming provider answers
         
     Returns:
         Analysis result as text
     """
     if provider == 'Gemini':
-        return analyze_with_gemini(prompt, image_data, model_name, temperature, max_tokens)
+        return analyze_with_gemini(prompt, image_info, model_name, temperature, max_tokens, on_chunk)
     elif provider == 'OpenAI':
-        return analyze_with_openai(prompt, image_data, model_name, temperature, max_tokens)
+        return analyze_with_openai(prompt, image_info, model_name, temperature, max_tokens)
     elif provider == 'Local':
-        return analyze_with_local(prompt, image_data, model_name, temperature, max_tokens)
+        return analyze_with_local(prompt, image_info, model_name, temperature, max_tokens)
     else:
         return f"ERROR: Unknown provider: {provider}"
+
+
+# MARK: - Async Analysis
+_http_session = None
+
+async def _get_http_session():
+    """Get the shared aiohttp session, created on first use inside the running loop"""
+    global _http_session
+    if _http_session is None or _http_session.closed:
+        aiohttp = _aiohttp()
+        _http_session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+    return _http_session
+
+async def close_http_session():
+    """Close the shared aiohttp session (must run on the loop that created it)"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+def supports_async(provider):
+    """Check whether a provider can be analyzed with analyze_image_async without blocking a thread"""
+    return provider == 'Gemini' and _aiohttp() is not None
+
+def _extract_gemini_text(data):
+    """Join the text parts of the first candidate in a Gemini REST response (or stream chunk)"""
+    candidates = data.get('candidates') or []
+    if not candidates:
+        return ""
+    
+    parts = candidates[0].get('content', {}).get('parts', [])
+    return "".join(part.get('text', '') for part in parts)
+
+async def analyze_with_gemini_async(prompt, image_info, model_name, temperature=0.7, max_tokens=100, on_chunk=None):
+    """Analyze an image by streaming from the Gemini REST API over the shared aiohttp session"""
+    api_key = get_api_key()
+    if not api_key:
+        return "ERROR: Gemini API key not configured"
+    
+    try:
+        # Encode off the event loop (only the first call per image actually encodes)
+        jpeg_bytes = await asyncio.to_thread(get_jpeg_bytes, image_info)
+        base64_image = base64.b64encode(jpeg_bytes).decode('ascii')
+        
+        # REST generateContent body: the prompt and the inline JPEG as parts of one user
+        # turn, with the same generation settings as _get_gemini_model (camelCase names)
+        payload = {
+            "contents": [{
+                "parts": [
+                    {"text": prompt},
+                    {"inline_data": {"mime_type": "image/jpeg", "data": base64_image}}
+                ]
+            }],
+            "generationConfig": {
+                "temperature": temperature,
+                "maxOutputTokens": max_tokens,
+                "topP": GEMINI_TOP_P,
+                "topK": GEMINI_TOP_K
+            }
+        }
+        
+        session = await _get_http_session()
+        
+        async def open_stream():
+            response = await session.post(
+                GEMINI_REST_STREAM_URL.format(model=model_name),
+                headers={"x-goog-api-key": api_key},
+                json=payload
+            )
+            if response.status in RETRYABLE_STATUS_CODES:
+                async with response:
+                    data = await response.json(content_type=None)
+                raise TransientAPIError(data.get('error', {}).get('message', response.reason))
+            return response
+        
+        response = await _call_with_retry_async(open_stream)
+        async with response:
+            if response.status != 200:
+                data = await response.json(content_type=None)
+                message = data.get('error', {}).get('message', response.reason)
+                return f"ERROR: Gemini API error: {message}"
+            
+            # Each server-sent event is a "data: {json}" line holding one chunk
+            chunks = []
+            async for line in response.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                
+                text = _extract_gemini_text(json.loads(line[5:]))
+                if text:
+                    chunks.append(text)
+                    if on_chunk:
+                        on_chunk(text)
+        
+        return "".join(chunks) or "ERROR: No response received from Gemini"
+    
+    except Exception as e:
+        return f"ERROR: Gemini API error: {str(e)}"
+
+async def analyze_image_async(provider, model_name, prompt, image_info, temperature=0.7, max_tokens=100, on_chunk=None):
+    """
+    Async version of analyze_image, run on an asyncio event loop
+    
+    Providers without an async client are run in the loop's default thread pool.
+    
+    Returns:
+        Analysis result as text
+    """
+    if supports_async(provider):
+        return await analyze_with_gemini_async(prompt, image_info, model_name, temperature, max_tokens, on_chunk)
+    return await asyncio.to_thread(
+        analyze_image, provider, model_name, prompt, image_info, temperature, max_tokens, on_chunk
+    )
+
+# MARK: - Batch Analysis
+def _build_batch_prompt(prompt, count):
+    """Extend a single-image prompt so the model answers for every image at once"""
+    return (
+        f"{prompt}\n\n"
+        f"You are given {count} images, numbered from 0 to {count - 1} in the order they appear. "
+        "Answer the question for each image separately and return only a JSON list with one "
+        'object per image, like [{"index": 0, "result": "<answer>"}].'
+    )
+
+def _parse_batch_response(text, count):
+    """
+    Parse a JSON list of per-image results returned by a batch request
+    
+    Args:
+        text: Raw response text from the model
+        count: Number of images that were sent
+        
+    Returns:
+        List of result strings in image order, or None if the response can't be used
+    """
+    # Strip markdown code fences if the model added them
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`")
+        if text.startswith("json"):
+            text = text[4:]
+    
+    try:
+        rows = json.loads(text)
+    except ValueError:
+        return None
+    
+    if not isinstance(rows, list):
+        return None
+    
+    results = [None] * count
+    for position, row in enumerate(rows):
+        if isinstance(row, dict):
+            index = row.get('index', position)
+            result = row.get('result')
+        else:
+            index, result = position, row
+        
+        if isinstance(index, int) and 0 <= index < count and result is not None:
+            results[index] = str(result)
+    
+    # Only accept the batch if every image got an answer
+    if any(result is None for result in results):
+        return None
+    return results
+
+def analyze_batch_with_gemini(prompt, images, model_name, temperature=0.7, max_tokens=100):
+    """
+    Analyze several images with a single Gemini request
+    
+    Args:
+        prompt: Text prompt for analysis
+        images: List of image info dictionaries from image_utils
+        model_name: Name of the model
+        temperature: Temperature for model generation
+        max_tokens: Maximum tokens for each image's answer
+        
+    Returns:
+        List of analysis results in image order, or None if the batch was rejected
+        (too large, truncated) or its response couldn't be parsed
+    """
+    count = len(images)
+    if _genai() is None:
+        return [GENAI_MISSING_ERROR] * count
+    
+    try:
+        if not _configure_gemini():
+            return ["ERROR: Gemini API key not configured"] * count
+        
+        # Budget output tokens for every answer plus the JSON wrapping
+        model = _get_gemini_model(model_name, temperature, (max_tokens + 20) * count, json_output=True)
+        
+        # Prompt first, then every image in order
+        contents = [_build_batch_prompt(prompt, count)]
+        contents.extend(
+            {"mime_type": "image/jpeg", "data": get_jpeg_bytes(image_info)} for image_info in images
+        )
+        
+        response = _call_with_retry(lambda: model.generate_content(contents))
+        text = response.text if hasattr(response, 'text') else str(response)
+        return _parse_batch_response(text, count)
+    
+    except Exception as e:
+        # A batch the API refuses (invalid/too large, or a reply with no usable text
+        # when the output budget ran out) may still work one image at a time
+        if isinstance(e, ValueError) or getattr(e, 'code', None) in (400, 413):
+            print(f"Gemini batch of {count} images rejected, falling back to single requests: {e}")
+            return None
+        return [f"ERROR: Gemini API error: {str(e)}"] * count
+
+def analyze_images(provider, model_name, prompt, images, temperature=0.7, max_tokens=100):
+    """
+    Analyze several images, batching them into as few requests as the provider supports
+    
+    Args:
+        provider: Provider name ('Gemini', 'OpenAI', 'Local')
+        model_name: Name of the model
+        prompt: Text prompt for analysis
+        images: List of image info dictionaries from image_utils
+        temperature: Temperature for model generation
+        max_tokens: Maximum tokens for each image's answer
+        
+    Returns:
+        List of analysis results as text, one per image in the same order
+    """
+    if not images:
+        return []
+    
+    # One request per image, sent concurrently
+    def analyze_each(chunk):
+        def analyze_one(image_info):
+            return analyze_image(provider, model_name, prompt, image_info, temperature, max_tokens)
+        
+        with ThreadPoolExecutor(max_workers=min(BATCH_MAX_WORKERS, len(chunk))) as executor:
+            return list(executor.map(analyze_one, chunk))
+    
+    if provider != 'Gemini' or len(images) == 1:
+        return analyze_each(images)
+    
+    # Gemini accepts many images in one request: send them in chunks of
+    # GEMINI_BATCH_MAX_IMAGES, falling back to single requests for a chunk that fails
+    results = []
+    for start in range(0, len(images), GEMINI_BATCH_MAX_IMAGES):
+        chunk = images[start:start + GEMINI_BATCH_MAX_IMAGES]
+        chunk_results = None
+        if len(chunk) > 1:
+            chunk_results = analyze_batch_with_gemini(prompt, chunk, model_name, temperature, max_tokens)
+        if chunk_results is None:
+            chunk_results = analyze_each(chunk)
+        results.extend(chunk_results)
+    
+    return results
@@ -79,7 +79,7 @@ class ESP32CamClient:
             return
             
         self.status_var.set("Triggering photo capture...")
-        self.root.update()
+        self.root.update_idletasks()
         
         try:
             # Send request to the trigger endpoint
@@ -102,7 +102,7 @@ class ESP32CamClient:
             
         self.esp32_url = f"http://{ip}"
         self.status_var.set(f"Connecting to {self.esp32_url}...")
-        self.root.update()
+        self.root.update_idletasks()
         
         try:
             # Try to connect to the ESP32-CAM with increased timeout
@@ -235,7 +235,10 @@ class ESP32CamClient:
         
         # Resize while preserving aspect ratio
         if ratio < 1:  # Only resize if image is larger than canvas
-            pil_img = pil_img.resize((new_width, new_height), Image.LANCZOS)
+            # Let the JPEG decoder scale down by 1/2, 1/4 or 1/8 in the DCT first
+            # (no-op for other formats), so LANCZOS filters far fewer pixels
+            pil_img.draft('RGB', (new_width, new_height))
+            pil_img = pil_img.resize((new_width, new_height), Image.LANCZOS, reducing_gap=3.0)
         
         # Convert to Tkinter format
         self.photo = ImageTk.PhotoImage(pil_img)
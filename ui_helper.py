@@ -2,10 +2,12 @@
 UI helper functions for Trash Analyzer
 """
 
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext
 from PIL import Image, ImageTk
 import cv2
+from image_utils import IMAGE_EXTENSIONS
 
 # MARK: - UI Creation Helpers
 def create_prompt_section(parent, default_prompt):
@@ -189,7 +191,7 @@ def create_camera_controls_panel(parent, camera_callbacks):
         'connect_var': connect_var
     }
 
-def create_config_section(parent, providers, models, analyze_callback):
+def create_config_section(parent, providers, models, analyze_callback, analyze_all_callback=None):
     """Create the configuration section"""
     config_frame = ttk.LabelFrame(parent, text="API Configuration")
     config_frame.pack(fill=tk.BOTH, expand=True)
@@ -264,13 +266,25 @@ def create_config_section(parent, providers, models, analyze_callback):
     
     max_length.trace_add("write", update_length_label)
     
-    # Analyze button
+    # Analyze buttons
+    analyze_frame = ttk.Frame(config_frame)
+    analyze_frame.grid(row=4, column=0, columnspan=3, pady=10)
+    
     analyze_button = ttk.Button(
-        config_frame,
+        analyze_frame,
         text="Analyze Image",
         command=analyze_callback
     )
-    analyze_button.grid(row=4, column=0, columnspan=3, pady=10)
+    analyze_button.pack(side=tk.LEFT, padx=2)
+    
+    analyze_all_button = None
+    if analyze_all_callback:
+        analyze_all_button = ttk.Button(
+            analyze_frame,
+            text="Analyze All",
+            command=analyze_all_callback
+        )
+        analyze_all_button.pack(side=tk.LEFT, padx=2)
     
     # Status label
     status_var = tk.StringVar(value="Ready")
@@ -283,6 +297,7 @@ def create_config_section(parent, providers, models, analyze_callback):
         'temperature': temperature,
         'max_length': max_length,
         'analyze_button': analyze_button,
+        'analyze_all_button': analyze_all_button,
         'status_var': status_var,
         'provider_combo': provider_combo,
         'model_combo': model_combo
@@ -305,26 +320,39 @@ def create_results_section(parent):
     return results_text
 
 # MARK: - Display Functions
-def display_image(image_label, img_rgb):
-    """Display an image on a label widget"""
+def display_image(image_label, img_rgb, image_info=None):
+    """Display an image on a label widget
+    
+    Args:
+        image_label: Label widget to show the image on
+        img_rgb: RGB image array (or None to clear the label)
+        image_info: Optional image info dictionary; the built PhotoImage is kept
+            under its 'photo' key so reselecting the image skips the resize
+    """
     if img_rgb is None:
         image_label.config(image='')
         return
     
-    # Resize image for display while maintaining aspect ratio
-    height, width = img_rgb.shape[:2]
     max_height = 400
     max_width = 500
     
-    # Calculate new dimensions
-    if height > max_height or width > max_width:
-        scale = min(max_height / height, max_width / width)
-        new_height, new_width = int(height * scale), int(width * scale)
-        img_rgb = cv2.resize(img_rgb, (new_width, new_height))
-    
-    # Convert to PhotoImage
-    img_pil = Image.fromarray(img_rgb)
-    img_tk = ImageTk.PhotoImage(image=img_pil)
+    img_tk = image_info.get('photo') if image_info is not None else None
+    if img_tk is None:
+        # Resize image for display while maintaining aspect ratio
+        height, width = img_rgb.shape[:2]
+        
+        # Calculate new dimensions
+        if height > max_height or width > max_width:
+            scale = min(max_height / height, max_width / width)
+            new_height, new_width = int(height * scale), int(width * scale)
+            img_rgb = cv2.resize(img_rgb, (new_width, new_height))
+        
+        # Convert to PhotoImage
+        img_pil = Image.fromarray(img_rgb)
+        img_tk = ImageTk.PhotoImage(image=img_pil)
+        
+        if image_info is not None:
+            image_info['photo'] = img_tk
     
     # Update label
     image_label.config(image=img_tk)
@@ -344,13 +372,87 @@ def update_results(results_text, text):
     
     results_text.config(state=tk.DISABLED)
 
+def append_results(results_text, text):
+    """Append text to the results widget (used while a response is streaming in)"""
+    results_text.config(state=tk.NORMAL)
+    results_text.insert(tk.END, text, "bold_large")
+    results_text.config(state=tk.DISABLED)
+    results_text.see(tk.END)
+
+# MARK: - Camera Preview Helpers
+# Guards the one pending preview frame per label (see post_preview_frame)
+_preview_slot_lock = threading.Lock()
+
+def post_preview_frame(label, image, preview_stop=None):
+    """
+    Hand a preview frame to the main thread through a single-slot buffer
+    
+    Only one update_label call is ever queued on the Tk event loop; a newer
+    frame replaces one that hasn't been shown yet, so a busy UI skips frames
+    instead of working through a backlog of stale ones.
+    
+    Args:
+        label: Tkinter label widget
+        image: RGB PIL image from image_utils.frame_to_preview_image
+        preview_stop: Optional threading.Event of the preview session the frame
+                      belongs to, passed on to update_label
+    """
+    with _preview_slot_lock:
+        scheduled = getattr(label, 'preview_pending', None) is not None
+        # The frame keeps its own session's event, so a stopped session's frame is dropped
+        label.preview_pending = (image, preview_stop)
+    
+    if not scheduled:
+        label.after(0, lambda: _show_pending_preview(label))
+
+def _show_pending_preview(label):
+    """Show the newest frame left by post_preview_frame (called in main thread)"""
+    with _preview_slot_lock:
+        pending = label.preview_pending
+        label.preview_pending = None
+    
+    if pending is not None:
+        update_label(label, *pending)
+
+def update_label(label, image, preview_stop=None):
+    """
+    Show a preview frame on a label (called in main thread)
+    
+    Frames are pasted into one of two PhotoImages kept on the label, so a new
+    Tk image is only allocated when the frame size changes. The buffers stay
+    on the label after the preview stops, so restarting it allocates nothing.
+    
+    Args:
+        label: Tkinter label widget
+        image: RGB PIL image from image_utils.frame_to_preview_image
+        preview_stop: Optional threading.Event; frames arriving after it is set are dropped
+    """
+    # Drop preview frames that arrive after the preview was stopped
+    if preview_stop is not None and preview_stop.is_set():
+        return
+    
+    buffers = getattr(label, 'preview_buffers', None)
+    if buffers is None or (buffers[0].width(), buffers[0].height()) != image.size:
+        buffers = [ImageTk.PhotoImage("RGB", image.size) for _ in range(2)]
+        label.preview_buffers = buffers
+    
+    # Fill the buffer that isn't on screen, show it, then swap. paste() copies
+    # PIL's pixels straight into the Tk photo block in C; a PPM string through
+    # PhotoImage(data=...) would add a tobytes() copy and a PPM parse on top
+    back = buffers[1]
+    back.paste(image)
+    label.config(image=back)
+    label.image = back  # Keep a reference to prevent garbage collection
+    buffers.reverse()
+
 # MARK: - Dialog Functions
 def get_image_paths_from_dialog():
     """Show file dialog and return selected image paths"""
     return filedialog.askopenfilenames(
         title="Select Images",
         filetypes=[
-            ("Image files", "*.jpg *.jpeg *.png *.bmp"),
+            # Tk matches patterns case-sensitively on Linux, so list both cases
+            ("Image files", " ".join(f"*{ext} *{ext.upper()}" for ext in IMAGE_EXTENSIONS)),
             ("All files", "*.*")
         ]
     )
\ No newline at end of file